@@ -1,19 +1,270 @@
 import datetime
 import json
-import os
+import random
 import re
-import ollama
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import llmClient
 from songRepository import ShantyRepository
+from promptAssembly import default_assembler
+from songbookStore import SongbookStore
+from songStreamParser import StreamingSongParser
+from songUtils import mean_score
+from structuralScorer import StructuralScorer
 
 class ShantyComposerService:
-    def __init__(self):
-        self.songRepository = ShantyRepository()
+    # Early-stop bar for compose_best_of when an evaluator scores the candidates (mean evaluator score, 1–5).
+    EVALUATED_THRESHOLD = 4.0
+
+    def __init__(self, encoder_backend="torch"):
+        self.songRepository = ShantyRepository(encoder_backend=encoder_backend)
+        self.prompts = default_assembler
+        self.songbook = SongbookStore()
+        self._scorer = None
     
     def compose_shanty(self, muse_prompt=None, model="mistral"):
+        return self.compose_entry(muse_prompt, model)[1]
+
+    def compose_entry(self, muse_prompt=None, model="mistral"):
+        """Compose and log a shanty; returns (songbook id, song), or (None, None) when nothing usable came back."""
+        if not muse_prompt:
+            print("❌ No muse prompt provided.")
+            return None, None
+        context, songs = self._select_seed_songs(muse_prompt)
+        new_song = self._compose_new_shanty(songs, context, model)
+        if not new_song:
+            return None, None
+        return self._log_generated_shanty(new_song, context, model), new_song
+
+    def compose_shanty_stream(self, muse_prompt=None, model="mistral", max_retries=1):
+        """Compose while streaming, yielding events as they happen.
+
+        Yields {"type": "verse", "text": ...} for each finished verse, {"type": "retry", ...}
+        when a generation is abandoned (discard the verses seen so far), then either
+        {"type": "song", "song": ..., "songbook_id": ...} with the logged song or {"type": "failed", ...}.
+        """
+        if not muse_prompt:
+            print("❌ No muse prompt provided.")
+            return
+        context, songs = self._select_seed_songs(muse_prompt)
+        prompt = self._build_shanty_prompt(songs, context)
+
+        reason = None
+        for attempt in range(max_retries + 1):
+            parser = StreamingSongParser()
+            stream = llmClient.chat(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True
+            )
+            try:
+                for chunk in stream:
+                    for verse in parser.feed(chunk["message"]["content"]):
+                        yield {"type": "verse", "text": verse}
+                    if parser.done or parser.diverged:
+                        break
+            finally:
+                # Stop the server generating tokens we are going to throw away.
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+
+            if not parser.done:
+                for verse in parser.finish():
+                    yield {"type": "verse", "text": verse}
+
+            if parser.done:
+                song_id = self._log_generated_shanty(parser.song, context, model)
+                yield {"type": "song", "song": parser.song, "songbook_id": song_id}
+                return
+
+            reason = parser.error
+            print(f"❌ Abandoned generation {attempt + 1}: {reason}")
+            if attempt < max_retries:
+                yield {"type": "retry", "attempt": attempt + 1, "reason": reason}
+
+        yield {"type": "failed", "reason": reason}
+
+    def compose_best_of(self, muse_prompt=None, model="mistral", n=3, threshold=None, evaluator=None, temperature=0.8):
+        """Compose `n` candidates concurrently and log only the best one.
+
+        Each attempt draws its own seed songs and sampling seed, streams its
+        generation and is scored as soon as it parses. With an `evaluator` (an
+        EvaluationAgentService) the score is the mean evaluator score, 1–5;
+        without one it is the StructuralScorer score, also 1–5 but only a sanity
+        gate, so nearly every well-formed song scores high on it.
+
+        The first candidate scoring at least `threshold` wins and attempts still
+        generating are cancelled; otherwise every attempt finishes and the best
+        one wins. `threshold` defaults to EVALUATED_THRESHOLD with an evaluator
+        and to no early stop without one; pass it explicitly to stop early on
+        structural scores. Candidates the structural scorer rejects never win.
+        The call returns as soon as there is a winner; an attempt already inside
+        the evaluator finishes in the background.
+
+        Returns {"song", "songbook_id", "evaluations", "candidates", "stats"}; "song" is None
+        when no candidate made it.
+        """
         if not muse_prompt:
             print("❌ No muse prompt provided.")
             return None
         self._validate_prompt(muse_prompt)
+        if threshold is None and evaluator is not None:
+            threshold = self.EVALUATED_THRESHOLD
+        scorer = self.scorer
+        stop = threading.Event()
+        started = time.perf_counter()
+        # A fresh base seed per call, so asking twice doesn't replay the same n candidates.
+        base_seed = random.randrange(2**31 - n)
+        candidates = [
+            {"attempt": attempt, "seed": base_seed + attempt, "status": "running", "score": None, "started_at": None,
+             "seconds": 0.0, "chars": 0, "song": None, "context": None, "evaluations": None}
+            for attempt in range(n)
+        ]
+        winner = None
+
+        pool = ThreadPoolExecutor(max_workers=n)
+        futures = [
+            pool.submit(self._compose_attempt, muse_prompt, model, candidate, temperature, stop, scorer, evaluator, started)
+            for candidate in candidates
+        ]
+        try:
+            for future in as_completed(futures):
+                candidate = future.result()
+                if candidate["status"] != "scored":
+                    continue
+                if winner is None or candidate["score"] > winner["score"]:
+                    winner = candidate
+                if threshold is not None and winner["score"] >= threshold:
+                    print(f"🏁 Attempt {winner['attempt'] + 1} scored {winner['score']:.2f}; cancelling the rest.")
+                    stop.set()
+                    break
+        finally:
+            # Stragglers notice `stop` at their next chunk; one already inside an evaluator finishes in the background.
+            pool.shutdown(wait=False, cancel_futures=True)
+        wall = time.perf_counter() - started
+
+        # Snapshot: attempts still running keep writing to their own dicts.
+        report = []
+        for candidate, future in zip(candidates, futures):
+            candidate = dict(candidate)
+            if not future.done():
+                candidate.update(status="cancelled", seconds=round(wall - (candidate["started_at"] or wall), 3))
+            report.append(candidate)
+
+        song, song_id, evaluations = None, None, None
+        if winner:
+            song, evaluations = winner["song"], winner["evaluations"]
+            song_id = self._log_generated_shanty(song, winner["context"], model)
+            if evaluations is not None:
+                self.songbook.update(song_id, dict(song, evaluations=evaluations))
+        else:
+            print(f"❌ None of {n} attempts produced a usable song.")
+
+        return {
+            "song": song,
+            "songbook_id": song_id,
+            "evaluations": evaluations,
+            "candidates": [{k: v for k, v in c.items() if k not in ("song", "context", "evaluations")} for c in report],
+            "stats": self._best_of_stats(report, winner, threshold, wall),
+        }
+
+    @property
+    def scorer(self):
+        if self._scorer is None:
+            self._scorer = StructuralScorer()
+        return self._scorer
+
+    def _compose_attempt(self, muse_prompt, model, candidate, temperature, stop, scorer, evaluator, started):
+        """One streamed generation for compose_best_of, filling in `candidate`; abandoned as soon as `stop` is set."""
+        began = time.perf_counter() - started
+        candidate["started_at"] = round(began, 3)
+        if stop.is_set():
+            candidate["status"] = "cancelled"
+            return candidate
+        # A fresh search per attempt: add_random varies the seed songs between candidates.
+        context, songs = self._select_seed_songs(muse_prompt)
+        candidate.update(context=context, seeds=[song.get("title") for song in songs])
+        parser = StreamingSongParser()
+        try:
+            stream = llmClient.chat(
+                model=model,
+                messages=[{"role": "user", "content": self._build_shanty_prompt(songs, context)}],
+                options={"temperature": temperature, "seed": candidate["seed"]},
+                stream=True
+            )
+            try:
+                for chunk in stream:
+                    candidate["chars"] += len(chunk["message"]["content"])
+                    parser.feed(chunk["message"]["content"])
+                    if parser.done or parser.diverged or stop.is_set():
+                        break
+            finally:
+                # Stop the server generating tokens nobody will read.
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+        except Exception as e:
+            candidate.update(status="failed", reason=str(e), seconds=round(time.perf_counter() - started - began, 3))
+            return candidate
+
+        if not parser.done and not parser.diverged and not stop.is_set():
+            parser.finish()
+        candidate["seconds"] = round(time.perf_counter() - started - began, 3)
+        if not parser.done:
+            if stop.is_set():
+                candidate["status"] = "cancelled"
+            else:
+                candidate.update(status="failed", reason=parser.error)
+            return candidate
+
+        song = parser.song
+        # Reviewers read "lines"; fill it in exactly as _log_generated_shanty will, so memoized scores match the logged song.
+        song["lines"] = song.get("lyrics", "").replace("\\n", "\n").strip()
+        screen = scorer.score(song)
+        candidate.update(song=song, title=song.get("title"), structural=screen["score"])
+        if screen["rejected"]:
+            candidate.update(status="rejected", score=screen["score"], reason="; ".join(screen["reasons"]))
+            return candidate
+        candidate.update(status="scored", score=screen["score"])
+        if evaluator is not None and not stop.is_set():
+            evaluations = evaluator.evaluate(song)
+            candidate.update(evaluations=evaluations, score=round(mean_score(evaluations), 2))
+        return candidate
+
+    def _best_of_stats(self, candidates, winner, threshold, wall):
+        finished = [c for c in candidates if c["status"] in ("scored", "rejected")]
+        cancelled = [c for c in candidates if c["status"] == "cancelled"]
+        # A cancelled attempt would have written about as much as the ones that finished, at its own pace so far.
+        typical_chars = sum(c["chars"] for c in finished) / len(finished) if finished else 0
+        typical_seconds = sum(c["seconds"] for c in finished) / len(finished) if finished else 0.0
+        remaining = {
+            c["attempt"]: c["seconds"] * (typical_chars / c["chars"] - 1) if c["chars"] else typical_seconds - c["seconds"]
+            for c in cancelled
+        }
+        remaining = {attempt: max(seconds, 0.0) for attempt, seconds in remaining.items()}
+        would_finish = max((c["started_at"] + c["seconds"] + remaining[c["attempt"]] for c in cancelled), default=0.0)
+        return {
+            "attempts": len(candidates),
+            "scored": sum(1 for c in candidates if c["status"] == "scored"),
+            "rejected": sum(1 for c in candidates if c["status"] == "rejected"),
+            "failed": sum(1 for c in candidates if c["status"] == "failed"),
+            "cancelled": len(cancelled),
+            "winner": winner["attempt"] if winner else None,
+            "winner_score": winner["score"] if winner else None,
+            "threshold": threshold,
+            "cleared_threshold": bool(winner and threshold is not None and winner["score"] >= threshold),
+            "wall_seconds": round(wall, 3),
+            "generation_seconds": round(sum(c["seconds"] for c in candidates), 3),
+            "generation_seconds_saved": round(sum(remaining.values(), 0.0), 3),
+            "wall_seconds_saved": round(max(would_finish - wall, 0.0), 3),
+        }
+
+    def _select_seed_songs(self, muse_prompt):
+        self._validate_prompt(muse_prompt)
+        # Newly approved songbook songs become seeds without rebuilding the index.
+        self.songRepository.sync_approved(self.songbook)
         context = muse_prompt["context"].strip()
         tone = muse_prompt["song_tone"].strip()
         type = muse_prompt["type"].strip()
@@ -28,11 +279,7 @@ class ShantyComposerService:
             k=3,
             add_random=True
         )
-        new_song = self._compose_new_shanty(songs, context, model)
-        if len(new_song) != 0:
-            self._log_generated_shanty(new_song, context)
-
-        return new_song
+        return context, songs
 
     def _build_shanty_prompt(self, seed_songs, context):
         ship_context = self._load_ship_context()
@@ -62,7 +309,7 @@ class ShantyComposerService:
     def _compose_new_shanty(self, seed_songs, context, model):
         prompt = self._build_shanty_prompt(seed_songs, context)
         
-        response = ollama.chat(
+        response = llmClient.chat(
             model=model,
             messages=[{"role": "user", "content": prompt}]
         )
@@ -81,35 +328,8 @@ class ShantyComposerService:
         
 
     def _load_ship_context(self, path="ship.json"):
-        with open(path, 'r', encoding='utf-8') as f:
-            ship_data = json.load(f)
-            crew = ship_data.get("crew", [])
-            ship = ship_data.get("ship", {})
-
-            # Crew descriptions
-            crew_descriptions = "\n".join([
-                f"{c['name']} ({c['role']}): {c['description']} Personality: {c['personality']}."
-                for c in crew
-            ])
-
-            # Devices and automation
-            devices = ship.get("devices", [])
-            device_descriptions = "\n".join([
-                f"- {d['device']} ({d['location']}): {d['purpose']}" for d in devices
-            ])
-
-            # Ship description
-            ship_summary = f"The ship is named the *{ship.get('name')}*, a {ship.get('build')} with {ship.get('total_sails', '?')} sails. It is {ship.get('length_inches')} inches long. " \
-                        f"Legend says: \"{ship.get('legend', 'She carries songs through the fog.')}\" " \
-                        f"\n\nQuirks: {', '.join(ship.get('quirks', []))}"
-
-            # Full lore context
-            lore_context = f"Here is the ship's context:\n{ship_summary}\n\n" \
-                        f"⚙️ Devices and Automation:\n{device_descriptions}\n\n" \
-                        f"🧠 Crew of agentic AI:\n{crew_descriptions}\n\n"
-            return lore_context
+        return self.prompts.ship_context(path)
 
-        
     def _validate_prompt(self, muse_prompt):
         if not muse_prompt:
             raise ValueError("Muse prompt is missing entirely.")
@@ -123,7 +343,7 @@ class ShantyComposerService:
         if missing_fields:
             raise ValueError(f"Muse prompt is missing required field(s): {', '.join(missing_fields)}")
 
-    def _log_generated_shanty(self, song_data, context, model="mistral", log_path="shanty_songbook.json"):
+    def _log_generated_shanty(self, song_data, context, model="mistral"):
         print("\n📜 Time to log this shanty.")
 
         # Add metadata
@@ -144,19 +364,10 @@ class ShantyComposerService:
         tags.update(["ai", "generated"])
         song_data["tags"] = list(tags)
 
-        # Load existing log
-        if os.path.exists(log_path):
-            with open(log_path, 'r', encoding='utf-8') as f:
-                log_data = json.load(f)
-        else:
-            log_data = []
-
-        # Append and save
-        log_data.append(song_data)
-        with open(log_path, 'w', encoding='utf-8') as f:
-            json.dump(log_data, f, indent=2, ensure_ascii=False)
+        song_id = self.songbook.append(song_data)
 
         print("✅ Shanty logged successfully\n")
+        return song_id
 
 # Test
 # composer = ShantyComposerService()
@@ -0,0 +1,116 @@
+import collections
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent encode calls into batched calls of `encode_fn`.
+
+    The first request to arrive opens a window of `max_wait_ms`; everything that
+    turns up before it closes (or until `max_batch_size` texts are waiting) is
+    encoded together and each caller gets back just its own rows. Requests already
+    at `max_batch_size` skip the queue and are encoded directly.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=64, max_wait_ms=2.0, history=1024):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending = collections.deque()
+        self._pending_texts = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+        self._metrics_lock = threading.Lock()
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.encode_seconds = 0.0
+        self.batch_sizes = collections.Counter()
+        self._waits = collections.deque(maxlen=history)
+
+    def encode(self, texts):
+        texts = list(texts)
+        if not texts:
+            return self.encode_fn(texts)
+        if len(texts) >= self.max_batch_size:
+            started = time.perf_counter()
+            vectors = self.encode_fn(texts)
+            self._record([0.0], len(texts), time.perf_counter() - started)
+            return vectors
+
+        future = Future()
+        with self._cond:
+            self._ensure_worker()
+            self._pending.append((texts, future, time.perf_counter()))
+            self._pending_texts += len(texts)
+            self._cond.notify()
+        return future.result()
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._work, name="embedding-batcher", daemon=True)
+            self._thread.start()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = self._pending[0][2] + self.max_wait
+                while self._pending_texts < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, size = [], 0
+                while self._pending and (not batch or size + len(self._pending[0][0]) <= self.max_batch_size):
+                    request = self._pending.popleft()
+                    batch.append(request)
+                    size += len(request[0])
+                self._pending_texts -= size
+            self._run(batch)
+
+    def _run(self, batch):
+        dispatched = time.perf_counter()
+        # Callers often ask for the same text (a popular query, a shared expansion term).
+        unique = list(dict.fromkeys(text for texts, _, _ in batch for text in texts))
+        try:
+            vectors = np.asarray(self.encode_fn(unique))
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        self._record([dispatched - queued for _, _, queued in batch], len(unique), time.perf_counter() - dispatched)
+
+        row = {text: i for i, text in enumerate(unique)}
+        for texts, future, _ in batch:
+            future.set_result(vectors[[row[text] for text in texts]])
+
+    def _record(self, waits, batch_size, seconds):
+        with self._metrics_lock:
+            self.requests += len(waits)
+            self.texts += batch_size
+            self.batches += 1
+            self.encode_seconds += seconds
+            self.batch_sizes[batch_size] += 1
+            self._waits.extend(waits)
+
+    def metrics(self):
+        with self._metrics_lock:
+            waits_ms = np.array(self._waits) * 1000 if self._waits else np.zeros(1)
+            return {
+                "requests": self.requests,
+                "texts": self.texts,
+                "batches": self.batches,
+                "mean_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+                "max_batch_size": max(self.batch_sizes) if self.batch_sizes else 0,
+                "requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "queue_wait_ms": {
+                    "p50": round(float(np.percentile(waits_ms, 50)), 3),
+                    "p99": round(float(np.percentile(waits_ms, 99)), 3),
+                },
+                "encode_seconds": round(self.encode_seconds, 3),
+            }
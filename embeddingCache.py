@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import numpy as np
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk embedding store keyed by model name and the sha256 of each text.
+
+    Each entry is one fixed-size record (the 32-byte digest followed by the
+    vector) in an append-only file that is opened memory-mapped, so a warm
+    start only reads the rows it is asked for and a miss only writes its own
+    rows. Entries written by a different model are rejected and rebuilt on the
+    next encode.
+
+    `dtype` may be float16 or int8 to shrink the store; int8 is a symmetric
+    scalar quantization that assumes normalized embeddings. encode() always
+    hands back float32.
+
+    Once the store passes `max_entries` it is compacted down to the three
+    quarters most recently used in this process, oldest first; None means no cap.
+    Texts requested by the encode() in progress are never evicted, so one
+    oversized batch can leave the store above the cap until the next compaction.
+    """
+
+    DTYPES = ("float32", "float16", "int8")
+
+    def __init__(self, encode_fn, model_name, cache_dir=".embedding_cache", dtype="float32", max_entries=100_000):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Unsupported embedding storage dtype: {dtype}")
+        self.encode_fn = encode_fn
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.dtype = dtype
+        self.max_entries = max_entries
+        self.slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        store = "" if dtype == "float32" else f"{dtype}."
+        self.records_path = self.sidecar_path(f"{store}records")
+        self.meta_path = self.sidecar_path(f"{store}meta.json")
+        self._lock = threading.Lock()
+        self._tick = 0
+        self.last_used = {}
+        self._load()
+
+    def sidecar_path(self, suffix):
+        """Path for derived data that should live and die with this model's cache."""
+        return os.path.join(self.cache_dir, f"{self.slug}.{suffix}")
+
+    def encode(self, texts):
+        hashes = [content_hash(t) for t in texts]
+        texts_by_key = dict(zip(hashes, texts))
+        computed = {}
+
+        with self._lock:
+            self._tick += 1
+            for key in hashes:
+                self.last_used[key] = self._tick
+            missing = [key for key in texts_by_key if key not in self.positions]
+        for _ in range(3):
+            unseen = [key for key in missing if key not in computed]
+            if unseen:
+                # Encode outside the lock; another thread may store the same texts meanwhile, which _append skips.
+                vectors = np.asarray(self.encode_fn([texts_by_key[key] for key in unseen]), dtype=np.float32)
+                computed.update(zip(unseen, vectors))
+            with self._lock:
+                if missing:
+                    self._append(missing, np.asarray([computed[key] for key in missing]), protect=texts_by_key)
+                # Another process may have compacted our rows away since we looked; store them again.
+                missing = [key for key in texts_by_key if key not in self.positions]
+                if missing:
+                    continue
+                if not hashes:
+                    dim = self.vectors.shape[1] if self.vectors is not None else 0
+                    return np.empty((0, dim), dtype=np.float32)
+                rows = [self.positions[key] for key in hashes]
+                return self._dequantize(self.vectors[rows])
+        raise RuntimeError(f"Could not store embeddings in {self.records_path}")
+
+    def _quantize(self, vectors):
+        if self.dtype == "int8":
+            return np.clip(np.round(vectors * 127), -127, 127).astype(np.int8)
+        return vectors.astype(self.dtype)
+
+    def _dequantize(self, stored):
+        if self.dtype == "int8":
+            return np.asarray(stored, dtype=np.float32) / 127
+        return np.asarray(stored, dtype=np.float32)
+
+    def _record_dtype(self, dim):
+        return np.dtype([("key", np.uint8, (32,)), ("vector", self.dtype, (dim,))])
+
+    def _load(self):
+        self.dim, self.records, self.vectors, self.keys, self.positions, self._inode = None, None, None, [], {}, None
+        if not (os.path.exists(self.records_path) and os.path.exists(self.meta_path)):
+            return
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable embedding cache {self.meta_path}: {e}")
+            return
+        if meta.get("model") != self.model_name or meta.get("dtype") != self.dtype or not meta.get("dim"):
+            print(f"⚠️ Discarding stale embedding cache for {self.model_name}")
+            return
+        self.dim = int(meta["dim"])
+        self._map_new_records()
+        if os.path.getsize(self.records_path) % self._record_dtype(self.dim).itemsize:
+            # A partial record, from a crash mid-append (or another writer's append landing right now). Rewrite
+            # the whole records into a new file so later appends stay aligned; a writer caught out retries.
+            kept = np.array(self.records) if self.records is not None else np.empty(0, dtype=self._record_dtype(self.dim))
+            self._rewrite(kept, self.dim)
+
+    def _map_new_records(self):
+        """Map the records file and index whatever rows were appended since the last call, by us or another process."""
+        record = self._record_dtype(self.dim)
+        # Stat and map through one handle, so a compaction swapping the file in between can't mix two files up.
+        with open(self.records_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != self._inode:
+                # A new file, after our own rewrite or another process's compaction: index it from the top.
+                self.keys, self.positions, self._inode = [], {}, stat.st_ino
+            # Anything past the last whole record is another writer's append still landing.
+            count = stat.st_size // record.itemsize
+            if count == 0:
+                # Nothing mapped means nothing pins this inode, so it could be reused; forget it.
+                self.records, self.vectors, self.keys, self.positions, self._inode = None, None, [], {}, None
+                return
+            self.records = np.memmap(f, dtype=record, mode="r", shape=(count,))
+        self.vectors = self.records["vector"]
+        for row in self.records["key"][len(self.keys):]:
+            key = row.tobytes().hex()
+            self.positions[key] = len(self.keys)
+            self.keys.append(key)
+
+    def _append(self, keys, new_vectors, protect=()):
+        if os.path.exists(self.records_path) and os.stat(self.records_path).st_ino != self._inode:
+            # Another process compacted or rebuilt the store since we mapped it; our row numbers are stale.
+            self._load()
+        fresh = [i for i, key in enumerate(keys) if key not in self.positions]
+        if not fresh:
+            return
+        keys, new_vectors = [keys[i] for i in fresh], new_vectors[fresh]
+        if self.dim != new_vectors.shape[1]:
+            # A fresh store, or the same model name with a different output size; the old rows are useless.
+            self._rewrite(np.empty(0, dtype=self._record_dtype(new_vectors.shape[1])), new_vectors.shape[1])
+        elif self.max_entries is not None and len(self.keys) + len(keys) > self.max_entries:
+            self._compact(len(keys), protect)
+
+        records = np.empty(len(keys), dtype=self._record_dtype(self.dim))
+        records["key"] = [np.frombuffer(bytes.fromhex(k), dtype=np.uint8) for k in keys]
+        records["vector"] = self._quantize(new_vectors)
+        # A single O_APPEND write per batch, so concurrent writers never interleave inside a record.
+        # If another process compacts between our check and the write, the rows go to the old file and encode() retries.
+        with open(self.records_path, "ab") as f:
+            f.write(records.tobytes())
+        self._map_new_records()
+
+    def _compact(self, incoming, protect=()):
+        """Shrink the store to three quarters of max_entries, never dropping a key in `protect` (the call in progress)."""
+        keep = max(self.max_entries * 3 // 4 - incoming, 0)
+        # Protected keys first, then most recently used in this process, then the newest rows; kept rows stay in file order.
+        ranked = sorted(range(len(self.keys)), key=lambda i: (self.keys[i] in protect, self.last_used.get(self.keys[i], 0), i), reverse=True)
+        keep = max(keep, sum(1 for key in self.keys if key in protect))
+        rows = np.sort(np.asarray(ranked[:keep], dtype=np.int64))
+        print(f"🧹 Compacting embedding cache for {self.model_name}: keeping {len(rows)} of {len(self.keys)} entries.")
+        kept = np.array(self.records[rows]) if self.records is not None else np.empty(0, dtype=self._record_dtype(self.dim))
+        evicted = set(self.keys) - {self.keys[i] for i in rows}
+        self.last_used = {k: t for k, t in self.last_used.items() if k not in evicted}
+        self._rewrite(kept, self.dim)
+
+    def _rewrite(self, records, dim):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_records = f"{self.records_path}.{os.getpid()}.tmp"
+        tmp_meta = f"{self.meta_path}.{os.getpid()}.tmp"
+        with open(tmp_records, "wb") as f:
+            f.write(records.tobytes())
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dtype": self.dtype, "dim": int(dim)}, f)
+        # Drop the memory map before replacing the file underneath it. Unmapped, the old inode can be reused
+        # for the new file, so forget it and index the new file from the top.
+        self.records, self.vectors, self.keys, self.positions, self._inode = None, None, [], {}, None
+        os.replace(tmp_records, self.records_path)
+        os.replace(tmp_meta, self.meta_path)
+        self.dim = int(dim)
+        self._map_new_records()
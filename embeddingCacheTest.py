@@ -0,0 +1,42 @@
+import tempfile
+import numpy as np
+from embeddingCache import EmbeddingCache
+
+
+# A deterministic stand-in for the sentence encoder: each text maps to its own fixed vector
+def fake_encode(texts):
+    return np.array([[len(t) / 10, sum(map(ord, t)) % 97 / 97, 1.0] for t in texts], dtype=np.float32)
+
+
+def test_oversized_batch():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = EmbeddingCache(fake_encode, "test-model", cache_dir, max_entries=8)
+        cache.encode([f"old {i}" for i in range(6)])
+        # Bigger than the compaction target of 6: none of it may be evicted while it's being read back.
+        batch = [f"batch {i}" for i in range(10)]
+        assert np.allclose(cache.encode(batch), fake_encode(batch))
+        assert np.allclose(cache.encode(batch[:3]), fake_encode(batch[:3]))
+    print("✅ A batch larger than the compaction target comes back whole")
+
+
+def test_shared_store():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        first = EmbeddingCache(fake_encode, "test-model", cache_dir, max_entries=8)
+        second = EmbeddingCache(fake_encode, "test-model", cache_dir, max_entries=8)
+        mine = [f"first {i}" for i in range(5)]
+        first.encode(mine)
+        # The second cache compacts the shared file and evicts everything the first one stored.
+        second.encode([f"second {i}" for i in range(8)])
+        texts = mine + ["first new"]
+        assert np.allclose(first.encode(texts), fake_encode(texts))
+        assert np.allclose(second.encode(texts), fake_encode(texts))
+    print("✅ Two caches on one store survive each other's compactions")
+
+
+def run_test():
+    test_oversized_batch()
+    test_shared_store()
+
+
+if __name__ == "__main__":
+    run_test()
@@ -0,0 +1,70 @@
+import json
+import sys
+import time
+import numpy as np
+from encoders import load_encoder
+from songRepository import ShantyRepository
+
+QUERIES = [
+    "calm seas and a weary crew under twilight",
+    "a storm off the point and a lost mainsail",
+    "rowdy capstan song for hauling the anchor",
+    "ghost ship drifting through the fog",
+]
+
+# Cosine scores may drift this far from the torch model's; int8 weights drift more than fp32 ONNX.
+MAX_SCORE_DRIFT = {"onnx": 0.01, "onnx-int8": 0.05}
+MIN_TOP_K_AGREEMENT = {"onnx": 0.95, "onnx-int8": 0.8}
+
+
+# Load the same documents the repository indexes
+def load_documents(json_path="shanties.json"):
+    with open(json_path, "r", encoding="utf-8") as f:
+        songs = json.load(f)["songs"]
+    return [ShantyRepository._document(song) for song in songs]
+
+
+def timed_encoder(backend, model_name):
+    started = time.perf_counter()
+    encoder = load_encoder(backend, model_name)
+    encoder.encode(["warm up"], normalize_embeddings=True)
+    return encoder, time.perf_counter() - started
+
+
+def query_latency_ms(encoder, repeats=20):
+    started = time.perf_counter()
+    for i in range(repeats):
+        encoder.encode([QUERIES[i % len(QUERIES)]], normalize_embeddings=True)
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def run_test(backends=("onnx", "onnx-int8"), model_name="all-MiniLM-L6-v2", k=5):
+    documents = load_documents()
+    reference, startup = timed_encoder("torch", model_name)
+    ref_docs = np.asarray(reference.encode(documents, normalize_embeddings=True))
+    ref_scores = np.asarray(reference.encode(QUERIES, normalize_embeddings=True)) @ ref_docs.T
+    ref_top = np.argsort(-ref_scores, axis=1)[:, :k]
+    print(f"\n🧭 torch: startup {startup:.2f}s, query {query_latency_ms(reference):.1f}ms")
+
+    passed = True
+    for backend in backends:
+        encoder, startup = timed_encoder(backend, model_name)
+        docs = np.asarray(encoder.encode(documents, normalize_embeddings=True))
+        scores = np.asarray(encoder.encode(QUERIES, normalize_embeddings=True)) @ docs.T
+        top = np.argsort(-scores, axis=1)[:, :k]
+
+        drift = float(np.abs(scores - ref_scores).max())
+        agreement = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, ref_top)])
+        ok = drift <= MAX_SCORE_DRIFT[backend] and agreement >= MIN_TOP_K_AGREEMENT[backend]
+        passed = passed and ok
+
+        print(f"\n=== {backend} ===")
+        print(f"Startup: {startup:.2f}s, query: {query_latency_ms(encoder):.1f}ms")
+        print(f"Max cosine drift: {drift:.4f} (limit {MAX_SCORE_DRIFT[backend]})")
+        print(f"Top-{k} agreement: {agreement:.2%} (min {MIN_TOP_K_AGREEMENT[backend]:.0%})")
+        print("✅ Parity OK" if ok else "❌ Parity FAILED")
+    return passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_test() else 1)
@@ -0,0 +1,159 @@
+import json
+import os
+import re
+import numpy as np
+
+ENCODER_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def _slug(model_name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+
+
+def encoder_cache_key(model_name, backend="torch"):
+    # Embeddings from different backends differ slightly, so they're cached apart.
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+class SentenceTransformerEncoder:
+    """The reference PyTorch model; loaded on first encode."""
+
+    backend = "torch"
+
+    def __init__(self, model_name="all-MiniLM-L6-v2"):
+        self.model_name = model_name
+        self.cache_key = encoder_cache_key(model_name)
+        self._model = None
+
+    def encode(self, texts, normalize_embeddings=True):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model.encode(texts, normalize_embeddings=normalize_embeddings)
+
+
+class OnnxEncoder:
+    """MiniLM on ONNX Runtime: tokenizer + transformer graph + mean pooling, no torch at runtime.
+
+    The graph is exported once per model into `model_dir` (that step still needs
+    torch); `quantized=True` runs a dynamically int8-quantized copy of it.
+    """
+
+    def __init__(self, model_name="all-MiniLM-L6-v2", quantized=False, model_dir=".onnx_models", threads=None, batch_size=32):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_name = model_name
+        self.backend = "onnx-int8" if quantized else "onnx"
+        self.cache_key = encoder_cache_key(model_name, self.backend)
+        self.batch_size = batch_size
+        self.export_dir = os.path.join(model_dir, _slug(model_name))
+
+        model_path = os.path.join(self.export_dir, "model.onnx")
+        if not os.path.exists(model_path):
+            export_onnx(model_name, self.export_dir)
+        if quantized:
+            model_path = quantize_onnx(model_path)
+
+        with open(os.path.join(self.export_dir, "encoder.json"), "r", encoding="utf-8") as f:
+            settings = json.load(f)
+        self.tokenizer = Tokenizer.from_file(os.path.join(self.export_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(settings["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=settings["pad_id"], pad_token=settings["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts, normalize_embeddings=True):
+        if isinstance(texts, str):
+            return self.encode([texts], normalize_embeddings)[0]
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            encoded = self.tokenizer.encode_batch(list(texts[start:start + self.batch_size]))
+            mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+            feeds = {
+                "input_ids": np.array([e.ids for e in encoded], dtype=np.int64),
+                "attention_mask": mask,
+                "token_type_ids": np.array([e.type_ids for e in encoded], dtype=np.int64),
+            }
+            hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+            # Mean over real tokens only, as the sentence-transformers Pooling layer does.
+            weights = mask[:, :, None].astype(np.float32)
+            batches.append((hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None))
+
+        embeddings = np.vstack(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+        if normalize_embeddings and len(embeddings):
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype(np.float32)
+
+
+def export_onnx(model_name, out_dir):
+    """One-time export of a mean-pooled sentence-transformers model to `out_dir`."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer, pooling = st[0], st[1]
+    # Older sentence-transformers only expose the per-mode flags.
+    mode = getattr(pooling, "pooling_mode", None) or ("mean" if getattr(pooling, "pooling_mode_mean_tokens", False) else None)
+    if mode != "mean":
+        raise ValueError(f"{model_name} does not use mean pooling; the ONNX encoder only supports mean")
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = st.tokenizer
+    tokenizer.save_pretrained(out_dir)
+    model = transformer.auto_model.eval()
+    sample = tokenizer(["a sample sentence"], return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    dynamic = {n: {0: "batch", 1: "sequence"} for n in names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    class _Hidden(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *args):
+            return self.inner(**dict(zip(names, args))).last_hidden_state
+
+    tmp_path = os.path.join(out_dir, "model.onnx.tmp")
+    with torch.no_grad():
+        torch.onnx.export(
+            _Hidden(model), tuple(sample[n] for n in names), tmp_path,
+            input_names=names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic, opset_version=17, dynamo=False,
+        )
+    os.replace(tmp_path, os.path.join(out_dir, "model.onnx"))
+
+    with open(os.path.join(out_dir, "encoder.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "model": model_name,
+            "max_seq_length": st.max_seq_length,
+            "pad_id": tokenizer.pad_token_id,
+            "pad_token": tokenizer.pad_token,
+        }, f, indent=2)
+    print(f"📦 Exported {model_name} to {out_dir}")
+
+
+def quantize_onnx(model_path):
+    """Dynamic int8 weight quantization of an exported graph; returns the quantized path."""
+    quantized_path = os.path.splitext(model_path)[0] + ".int8.onnx"
+    if not os.path.exists(quantized_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+
+def load_encoder(backend="torch", model_name="all-MiniLM-L6-v2", **kwargs):
+    """Encoder for `backend` (see ENCODER_BACKENDS); every one honours encode(texts, normalize_embeddings=True)."""
+    if backend == "torch":
+        return SentenceTransformerEncoder(model_name)
+    if backend == "onnx":
+        return OnnxEncoder(model_name, **kwargs)
+    if backend == "onnx-int8":
+        return OnnxEncoder(model_name, quantized=True, **kwargs)
+    raise ValueError(f"Unknown encoder backend: {backend}")
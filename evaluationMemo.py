@@ -0,0 +1,75 @@
+import argparse
+import json
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class EvaluationMemo:
+    """SQLite store of evaluator results keyed by (song hash, evaluator version, model).
+
+    The evaluator version hashes everything that shapes its prompt: the
+    definition (template, description, dependencies, run_if), the decoding
+    options, the content of the data it reads and the versions of the
+    preprocessors it waits on. A stored result is reused only while all of
+    those, the song's title and lyrics, and the model are unchanged.
+    """
+
+    def __init__(self, db_path="evaluation_memo.db"):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS evaluations (
+                    song_hash TEXT NOT NULL,
+                    evaluator_version TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    evaluator TEXT,
+                    created_at TEXT,
+                    result TEXT NOT NULL,
+                    PRIMARY KEY (song_hash, evaluator_version, model)
+                );
+                CREATE INDEX IF NOT EXISTS idx_evaluations_evaluator ON evaluations(evaluator);
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, song_hash, evaluator_version, model):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result FROM evaluations WHERE song_hash = ? AND evaluator_version = ? AND model = ?",
+                (song_hash, evaluator_version, model)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, song_hash, evaluator_version, model, evaluator, result):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO evaluations (song_hash, evaluator_version, model, evaluator, created_at, result) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (song_hash, evaluator_version, model, evaluator, datetime.now().isoformat(), json.dumps(result, ensure_ascii=False))
+            )
+
+    def counts(self):
+        """Stored results per (evaluator, model)."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT evaluator, model, COUNT(*), COUNT(DISTINCT evaluator_version) FROM evaluations GROUP BY evaluator, model ORDER BY evaluator"
+            ).fetchall()
+        return [{"evaluator": e, "model": m, "results": n, "versions": v} for e, m, n, v in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the evaluation memo.")
+    parser.add_argument("--db", default="evaluation_memo.db")
+    args = parser.parse_args()
+
+    for row in EvaluationMemo(args.db).counts():
+        print(f"{row['evaluator']} [{row['model']}]: {row['results']} result(s) across {row['versions']} version(s)")
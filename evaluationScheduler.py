@@ -0,0 +1,115 @@
+import json
+import os
+
+
+def _truthy(value):
+    # Preprocessors answer in JSON, but small models sometimes quote their booleans.
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "yes", "1")
+    return bool(value)
+
+
+class EvaluationDAG:
+    """Dependency graph over preprocessors, evaluators and the data they read.
+
+    Node names are "pre:<file>", "eval:<name>" and "data:<key>". An evaluator's
+    `dependencies` (from its JSON and from the registry) can name a preprocessor
+    (by file or name), a field a preprocessor outputs, a registered provider, or a
+    data source for PromptAssembler.dependency. Registry entries may also carry
+    `run_if`, e.g. {"requires_strict_canon_check": true}: the evaluator then
+    waits for the preprocessor producing that field and is skipped when the
+    field says it isn't needed.
+
+    Data and provider results are handed to templates under their own names, so
+    those names can't shadow the variables every evaluator template gets.
+    """
+
+    RESERVED_NAMES = ("agent", "song_title", "lyrics", "dependencies", "semantic")
+
+    def __init__(self, evaluators, preprocessors=(), registry=None, providers=None):
+        self.providers = dict(providers or {})
+        self.preprocessors = {f"pre:{p['_file']}": p for p in preprocessors}
+        self.nodes = {}
+        self.evaluator_nodes = []
+
+        by_name = {entry.get("name"): entry for entry in registry or []}
+        for evaluator in evaluators:
+            evaluator = self._merge_registry(evaluator, by_name.get(evaluator.get("name")))
+            name = f"eval:{evaluator.get('name')}"
+            deps = [self._resolve(dep) for dep in evaluator.get("dependencies", [])]
+            deps += [self._resolve(key) for key in evaluator.get("run_if", {})]
+            self.nodes[name] = {"kind": "evaluator", "spec": evaluator, "deps": list(dict.fromkeys(deps))}
+            self.evaluator_nodes.append(name)
+
+        self.order = self._topological_order()
+
+    @staticmethod
+    def _merge_registry(evaluator, entry):
+        if not entry:
+            return evaluator
+        merged = dict(entry, **evaluator)
+        merged["dependencies"] = list(dict.fromkeys(evaluator.get("dependencies", []) + entry.get("dependencies", [])))
+        merged["run_if"] = dict(entry.get("run_if", {}), **evaluator.get("run_if", {}))
+        return merged
+
+    def _resolve(self, dep):
+        for node, preprocessor in self.preprocessors.items():
+            if dep in (preprocessor["_file"], preprocessor.get("name")) or dep in preprocessor.get("output_format", {}):
+                self.nodes.setdefault(node, {"kind": "preprocessor", "spec": preprocessor, "deps": []})
+                return node
+        if dep in self.RESERVED_NAMES:
+            raise ValueError(f"Dependency {dep!r} clashes with a template variable every evaluator gets; rename it")
+        node = f"data:{dep}"
+        self.nodes.setdefault(node, {"kind": "provider" if dep in self.providers else "data", "spec": dep, "deps": []})
+        return node
+
+    def _topological_order(self):
+        order, state = [], {}
+
+        def visit(node, path):
+            if state.get(node) == "done":
+                return
+            if state.get(node) == "visiting":
+                raise ValueError(f"Dependency cycle: {' -> '.join(path + [node])}")
+            state[node] = "visiting"
+            for dep in self.nodes[node]["deps"]:
+                visit(dep, path + [node])
+            state[node] = "done"
+            order.append(node)
+
+        for node in self.nodes:
+            visit(node, [])
+        return order
+
+    def skip_reason(self, node, outputs):
+        """Why `node` needn't run given upstream outputs, or None to run it."""
+        for key, expected in self.nodes[node]["spec"].get("run_if", {}).items():
+            upstream = outputs.get(self._resolve(key))
+            if not isinstance(upstream, dict) or key not in upstream or "error" in upstream:
+                continue  # Fail open: without the signal, run the evaluator.
+            if _truthy(upstream[key]) != _truthy(expected):
+                return f"{key} is {upstream[key]}"
+        return None
+
+    def context(self, node, outputs):
+        """Upstream results handed to an evaluator's template."""
+        dependencies, semantic = {}, {}
+        for dep in self.nodes[node]["deps"]:
+            kind, spec = self.nodes[dep]["kind"], self.nodes[dep]["spec"]
+            if kind == "preprocessor":
+                semantic[spec["_file"]] = outputs.get(dep)
+            else:
+                dependencies[spec] = outputs.get(dep)
+        # Keys that are valid names are also passed directly, e.g. {{ similar_songs }}.
+        direct = {key: value for key, value in dependencies.items() if key.isidentifier()}
+        return dict(direct, dependencies=dependencies, semantic=semantic)
+
+    def describe(self):
+        return {node: self.nodes[node]["deps"] for node in self.order}
+
+
+def load_registry(path="registries/evaluator_registry.json"):
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
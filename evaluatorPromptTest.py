@@ -0,0 +1,47 @@
+import json
+import llmClient
+from philosopherService import EvaluationAgentService
+from songStreamParser import StreamingSongParser
+
+LYRICS = [
+    "Oh the fog rolls in upon the bay", "We haul the lines and heave away",
+    "The captain calls across the deck", "We trim the sails and mind the wreck",
+    "", "Haul away, haul away, the tide is turning", "Haul away, haul away, the lamps are burning",
+    "", "The wind is fresh upon the sea", "The anchor's up and we sail free",
+    "The mast is tall, the rope is strong", "We sing the crew a sailing song",
+]
+
+prompts = []
+
+
+# Stands in for the LLM: records every prompt and answers with a JSON object every evaluator accepts
+def fake_chat(model, messages, options=None, stream=False, **kwargs):
+    prompts.append(messages[-1]["content"])
+    return {"message": {"role": "assistant", "content": json.dumps({"score": 4, "requires_strict_canon_check": True})}}
+
+
+def composed_song():
+    # Exactly what the composer's streaming parser hands back: "lyrics" with literal \n, no "lines".
+    raw = json.dumps({"title": "Haul Away the Fog", "tone": "joyful", "lyrics": "\\n".join(LYRICS),
+                      "theme": "departure", "structure": "verse-chorus", "tags": ["fog"]})
+    parser = StreamingSongParser()
+    parser.feed(raw)
+    assert parser.done, parser.error
+    assert "lines" not in parser.song
+    return parser.song
+
+
+def run_test():
+    llmClient.chat = fake_chat
+    service = EvaluationAgentService(memo_path=None)
+    results = service.evaluate(composed_song())
+
+    assert prompts, f"No LLM evaluator ran: {results}"
+    for prompt in prompts:
+        for line in ("We haul the lines and heave away", "The anchor's up and we sail free"):
+            assert line in prompt, f"Lyrics missing from prompt:\n{prompt}"
+    print(f"✅ All {len(prompts)} LLM prompts carry the song's lyrics")
+
+
+if __name__ == "__main__":
+    run_test()
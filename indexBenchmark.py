@@ -0,0 +1,113 @@
+import argparse
+import json
+import time
+import faiss
+import numpy as np
+from vectorIndex import build_index, index_bytes, make_index_config, search_params
+
+DEFAULT_CONFIGS = [
+    "flat",
+    "flat:quantization=fp16",
+    "flat:quantization=int8",
+    "ivf:nprobe=4",
+    "ivf:nprobe=16",
+    "ivf:nprobe=16,pq_m=16",
+    "hnsw:ef_search=32",
+    "hnsw:ef_search=128",
+    "hnsw:ef_search=128,quantization=int8",
+]
+
+
+def parse_config(spec):
+    """'ivf:nlist=512,nprobe=8' -> index config dict."""
+    kind, _, params = spec.partition(":")
+    overrides = {}
+    for pair in filter(None, params.split(",")):
+        key, _, value = pair.partition("=")
+        overrides[key.strip()] = int(value) if value.strip().isdigit() else value.strip()
+    return make_index_config(kind=kind.strip(), **overrides)
+
+
+def synthetic_corpus(n, dim, clusters, seed):
+    # Clustered unit vectors behave more like sentence embeddings than uniform noise does.
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    points = centers[rng.integers(0, clusters, n)] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+
+def repository_corpus(json_path, encoder_backend="torch"):
+    from songRepository import ShantyRepository
+    repo = ShantyRepository(json_path, encoder_backend=encoder_backend)
+    ids = np.array(sorted(repo.songs_by_id), dtype=np.int64)
+    return np.vstack([repo.index.reconstruct(int(i)) for i in ids]).astype(np.float32)
+
+
+def make_queries(corpus, count, seed):
+    rng = np.random.default_rng(seed + 1)
+    picks = corpus[rng.integers(0, len(corpus), count)]
+    queries = picks + 0.1 * rng.standard_normal(picks.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def run_benchmark(corpus, queries, configs, k=10, filter_fraction=1.0, seed=0):
+    ids = np.arange(len(corpus), dtype=np.int64)
+    rng = np.random.default_rng(seed + 2)
+    allowed = ids if filter_fraction >= 1.0 else np.sort(rng.choice(ids, max(k, int(len(ids) * filter_fraction)), replace=False))
+    selector = faiss.IDSelectorBatch(allowed)
+
+    truth_config = make_index_config(kind="flat")
+    truth_index, _ = build_index(corpus, ids, truth_config)
+    _, truth = truth_index.search(queries, k, params=search_params(truth_index, truth_config, selector))
+
+    results = []
+    for config in configs:
+        started = time.perf_counter()
+        index, spec = build_index(corpus, ids, config)
+        build_seconds = time.perf_counter() - started
+        params = search_params(index, config, selector)
+
+        latencies = []
+        hits = 0
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            _, found = index.search(query[None, :], k, params=params)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += len(set(found[0][found[0] >= 0]) & set(expected[expected >= 0]))
+
+        results.append({
+            "config": {key: value for key, value in config.items() if value is not None},
+            "factory": spec,
+            f"recall@{k}": round(hits / (k * len(queries)), 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            "build_seconds": round(build_seconds, 3),
+            "index_bytes": index_bytes(index),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare ANN index and quantization settings against exact float32 search.")
+    parser.add_argument("--synthetic", type=int, default=20000, help="synthetic corpus size (0 = use shanties.json)")
+    parser.add_argument("--songs", default="shanties.json")
+    parser.add_argument("--encoder-backend", default="torch", help="torch | onnx | onnx-int8 (with --synthetic 0)")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--filter-fraction", type=float, default=1.0, help="share of ids the metadata filter lets through")
+    parser.add_argument("--config", action="append", help="e.g. 'ivf:nlist=512,nprobe=8' (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        corpus = synthetic_corpus(args.synthetic, args.dim, args.clusters, args.seed)
+    else:
+        corpus = repository_corpus(args.songs, args.encoder_backend)
+    queries = make_queries(corpus, args.queries, args.seed)
+    configs = [parse_config(spec) for spec in (args.config or DEFAULT_CONFIGS)]
+
+    print(f"📏 {len(corpus)} vectors x {corpus.shape[1]} dims, {len(queries)} queries, k={args.k}")
+    for row in run_benchmark(corpus, queries, configs, args.k, args.filter_fraction, args.seed):
+        print(json.dumps(row))
@@ -0,0 +1,314 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import httpx
+import ollama
+
+
+def is_deterministic(options):
+    """Only cache when the same request is expected to give the same answer."""
+    options = options or {}
+    return options.get("temperature") == 0 or options.get("seed") is not None
+
+
+class LLMResponseCache:
+    """Content-addressed chat response cache on disk with size-based LRU eviction.
+
+    Each response is a small JSON file named by the hash of (model, messages,
+    options). A hit bumps the file's mtime, and eviction removes the oldest files
+    first once the directory grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir=".llm_cache", max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def key(self, model, messages, options=None, **kwargs):
+        payload = json.dumps(
+            {"model": model, "messages": messages, "options": options or {}, "extra": kwargs},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                response = json.load(f)
+            os.utime(path)
+            return response
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def put(self, key, response):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(response, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self._total_bytes += os.path.getsize(path)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
+
+    def _entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+
+default_cache = LLMResponseCache()
+
+
+class OllamaHost:
+    """One Ollama endpoint: a persistent client plus the counters the pool routes on."""
+
+    def __init__(self, url, models=None, timeout=600):
+        self.url = url
+        # None means the host is assumed to serve every model.
+        self.models = set(models) if models else None
+        # ollama.Client keeps an httpx connection pool, so requests reuse sockets.
+        self.client = ollama.Client(host=url, timeout=timeout)
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+        self.missing_models = set()
+
+    def serves(self, model):
+        return model not in self.missing_models and (self.models is None or model in self.models)
+
+    def stats(self, now):
+        return {
+            "url": self.url,
+            "healthy": now >= self.down_until,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class OllamaPool:
+    """Routes chat calls across Ollama hosts.
+
+    A request goes to the healthy host serving its model with the fewest requests
+    in flight. Connection errors, timeouts and 5xx/429 answers are retried on
+    another host with exponential backoff; a host that fails `failure_threshold`
+    times in a row sits out for `cooldown_seconds`. A host answering 404 for a
+    model is skipped for that model from then on.
+    """
+
+    def __init__(self, hosts, max_retries=2, backoff_seconds=0.5, max_backoff_seconds=8.0,
+                 failure_threshold=2, cooldown_seconds=30.0, clock=time.monotonic, sleep=time.sleep):
+        if not hosts:
+            raise ValueError("OllamaPool needs at least one host")
+        self.hosts = hosts
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """`config` is {"hosts": [{"url": ..., "models": [...], "timeout": ...}], ...pool settings}."""
+        config = dict(config)
+        hosts = [
+            OllamaHost(h["url"], h.get("models"), h.get("timeout", 600)) if isinstance(h, dict) else OllamaHost(h)
+            for h in config.pop("hosts")
+        ]
+        return cls(hosts, **config)
+
+    def chat(self, model, messages, options=None, stream=False, **kwargs):
+        tried = set()
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            host = self._acquire(model, tried)
+            if host is None:
+                break
+            tried.add(host)
+            try:
+                response = host.client.chat(model=model, messages=messages, options=options, stream=stream, **kwargs)
+                if stream:
+                    # Nothing is sent until the stream is read, so pull the first chunk here where it can still be retried.
+                    chunks = iter(response)
+                    first = next(chunks)
+                    return self._stream(host, first, chunks)
+                self._release(host, ok=True)
+                return response
+            except StopIteration:
+                self._release(host, ok=True)
+                return iter(())
+            except Exception as e:
+                if not self._retryable(e):
+                    self._release(host, ok=not self._host_fault(e))
+                    if isinstance(e, ollama.ResponseError) and e.status_code == 404:
+                        with self._lock:
+                            host.missing_models.add(model)
+                        last_error = e
+                        continue
+                    raise
+                self._release(host, ok=False)
+                last_error = e
+                print(f"⚠️ {host.url} failed for {model} ({e}); retrying")
+                if attempt < self.max_retries:
+                    delay = min(self.backoff_seconds * 2 ** attempt, self.max_backoff_seconds)
+                    self.sleep(delay * random.uniform(0.5, 1.0))
+        if last_error is not None:
+            raise last_error
+        raise ConnectionError(f"No Ollama host available for model {model}")
+
+    def _stream(self, host, first, chunks):
+        ok = False
+        try:
+            yield first
+            for chunk in chunks:
+                yield chunk
+            ok = True
+        except GeneratorExit:
+            # The caller stopped reading; that says nothing about the host.
+            ok = True
+            raise
+        finally:
+            # Closing the underlying stream drops the HTTP response, which stops generation.
+            close = getattr(chunks, "close", None)
+            if close:
+                close()
+            self._release(host, ok=ok)
+
+    def _acquire(self, model, tried):
+        with self._lock:
+            now = self.clock()
+            candidates = [h for h in self.hosts if h.serves(model) and h not in tried]
+            healthy = [h for h in candidates if now >= h.down_until]
+            # With every host cooling down, try the one due back soonest rather than failing outright.
+            pool = healthy or sorted(candidates, key=lambda h: h.down_until)[:1]
+            if not pool:
+                return None
+            host = min(pool, key=lambda h: (h.outstanding, h.requests))
+            host.outstanding += 1
+            host.requests += 1
+            return host
+
+    def _release(self, host, ok):
+        with self._lock:
+            host.outstanding -= 1
+            if ok:
+                host.consecutive_failures = 0
+                return
+            host.errors += 1
+            host.consecutive_failures += 1
+            if host.consecutive_failures >= self.failure_threshold:
+                host.down_until = self.clock() + self.cooldown_seconds
+                print(f"🚫 Taking {host.url} out of rotation for {self.cooldown_seconds:.0f}s")
+
+    @staticmethod
+    def _retryable(error):
+        if isinstance(error, ollama.ResponseError):
+            return error.status_code >= 500 or error.status_code == 429
+        return isinstance(error, (ConnectionError, httpx.TransportError))
+
+    @staticmethod
+    def _host_fault(error):
+        return isinstance(error, ollama.ResponseError) and error.status_code >= 500
+
+    def stats(self):
+        with self._lock:
+            now = self.clock()
+            return [host.stats(now) for host in self.hosts]
+
+
+def load_pool(config_path="llm_hosts.json"):
+    """Pool from `config_path` if it exists, else OLLAMA_HOSTS (comma-separated, `url=model|model`), else OLLAMA_HOST."""
+    if os.path.exists(config_path):
+        with open(config_path, "r", encoding="utf-8") as f:
+            return OllamaPool.from_config(json.load(f))
+    hosts = []
+    for entry in filter(None, (e.strip() for e in os.environ.get("OLLAMA_HOSTS", "").split(","))):
+        url, _, models = entry.partition("=")
+        hosts.append({"url": url, "models": [m for m in models.split("|") if m]})
+    if not hosts:
+        hosts = [{"url": os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")}]
+    return OllamaPool.from_config({"hosts": hosts})
+
+
+_default_pool = None
+_pool_lock = threading.Lock()
+
+
+def default_pool():
+    global _default_pool
+    with _pool_lock:
+        if _default_pool is None:
+            _default_pool = load_pool()
+        return _default_pool
+
+
+def configure_pool(pool):
+    """Swap the pool every service's chat() goes through (e.g. OllamaPool.from_config({...}))."""
+    global _default_pool
+    with _pool_lock:
+        _default_pool = pool
+
+
+def chat(model, messages, options=None, stream=False, cache=True, **kwargs):
+    """Drop-in for ollama.chat that reuses earlier answers to deterministic requests
+    and spreads the rest across the configured host pool."""
+    response_cache = default_cache if cache is True else cache or None
+    if stream or response_cache is None or not is_deterministic(options):
+        return default_pool().chat(model=model, messages=messages, options=options, stream=stream, **kwargs)
+
+    key = response_cache.key(model, messages, options, **kwargs)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+
+    response = default_pool().chat(model=model, messages=messages, options=options, **kwargs)
+    response_cache.put(key, {
+        "model": model,
+        "message": {
+            "role": response["message"]["role"],
+            "content": response["message"]["content"]
+        }
+    })
+    return response
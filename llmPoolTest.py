@@ -0,0 +1,102 @@
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from llmClient import OllamaHost, OllamaPool
+
+
+# A stand-in for an Ollama server: answers /api/chat after `delay`, or fails with `status`
+def start_stub(name, models=("mistral",), delay=0.05, status=200):
+    state = {"name": name, "delay": delay, "status": status, "calls": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            state["calls"] += 1
+            time.sleep(state["delay"])
+            if state["status"] != 200:
+                self._send(state["status"], {"error": f"{name} is unwell"})
+            elif body["model"] not in models:
+                self._send(404, {"error": f"model '{body['model']}' not found"})
+            elif body.get("stream"):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for word in ["yo ", "ho ", "ho"]:
+                    self.wfile.write((json.dumps(self._chunk(body, word, False)) + "\n").encode())
+                self.wfile.write((json.dumps(self._chunk(body, "", True)) + "\n").encode())
+            else:
+                self._send(200, self._chunk(body, name, True))
+
+        def _chunk(self, body, content, done):
+            return {"model": body["model"], "created_at": "2024-01-01T00:00:00Z",
+                    "message": {"role": "assistant", "content": content}, "done": done}
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", state, server
+
+
+def unused_port_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+
+def ask(pool, model="mistral"):
+    return pool.chat(model=model, messages=[{"role": "user", "content": "sing"}])["message"]["content"]
+
+
+def run_test():
+    url_a, a, _ = start_stub("a")
+    url_b, b, _ = start_stub("b", models=("mistral", "llama3"))
+    dead = unused_port_url()
+    pool = OllamaPool(
+        [OllamaHost(url_a, timeout=5), OllamaHost(url_b, timeout=5), OllamaHost(dead, timeout=1)],
+        backoff_seconds=0.01, cooldown_seconds=60,
+    )
+
+    # Least-outstanding routing spreads concurrent load; the dead host fails over and is benched.
+    with ThreadPoolExecutor(8) as workers:
+        answers = list(workers.map(lambda _: ask(pool), range(24)))
+    assert set(answers) <= {"a", "b"}, answers
+    assert a["calls"] > 4 and b["calls"] > 4, (a["calls"], b["calls"])
+    assert not pool.stats()[2]["healthy"], pool.stats()
+    print(f"✅ Load balanced: a={a['calls']} b={b['calls']}, dead host benched")
+
+    # Routing by model: only b serves llama3.
+    assert all(ask(pool, "llama3") == "b" for _ in range(3))
+    print("✅ Routed llama3 to the host that has it")
+
+    # A host answering 500 is retried elsewhere, then taken out of rotation.
+    a["status"] = 500
+    assert all(ask(pool) == "b" for _ in range(4))
+    assert not pool.stats()[0]["healthy"], pool.stats()
+    print("✅ Failed over from a 500-ing host")
+
+    # Streams go through the pool too.
+    a["status"] = 200
+    text = "".join(chunk["message"]["content"] for chunk in pool.chat(model="mistral", messages=[], stream=True))
+    assert text == "yo ho ho", text
+    assert all(h["outstanding"] == 0 for h in pool.stats()), pool.stats()
+    print("✅ Streaming works and releases its host")
+
+    for host in pool.stats():
+        print(host)
+
+
+if __name__ == "__main__":
+    run_test()
@@ -0,0 +1,89 @@
+import json
+import numpy as np
+from embeddingCache import EmbeddingCache
+from encoders import encoder_cache_key, load_encoder
+
+
+def estimate_tokens(item):
+    # Roughly four characters per token for English JSON; close enough for budgeting.
+    return max(1, len(json.dumps(item, ensure_ascii=False)) // 4)
+
+
+class LoreContextSelector:
+    """Picks the lore entries most relevant to a request and caps them to a token budget.
+
+    Entries are embedded once (through the shared embedding cache), so each
+    request costs one query encode and a dot product however large the lore grows.
+    """
+
+    IMPORTANCE_WEIGHT = 0.02
+
+    def __init__(self, encoder=None, model_name="all-MiniLM-L6-v2", cache_dir=".embedding_cache", token_budget=1200, encoder_backend="torch"):
+        self._encoder = encoder
+        self.model_name = model_name
+        self.encoder_backend = encoder_backend
+        self.token_budget = token_budget
+        cache_key = getattr(encoder, "cache_key", None) or encoder_cache_key(model_name, encoder_backend)
+        self.embedding_cache = EmbeddingCache(self._encode, cache_key, cache_dir)
+        self.groups = {}
+
+    def _encode(self, texts):
+        if self._encoder is None:
+            self._encoder = load_encoder(self.encoder_backend, self.model_name)
+        return self._encoder.encode(texts, normalize_embeddings=True)
+
+    def add_group(self, name, items):
+        items = list(items)
+        texts = [json.dumps(item, ensure_ascii=False) if not isinstance(item, str) else item for item in items]
+        embeddings = self.embedding_cache.encode(texts) if texts else None
+        self.groups[name] = {
+            "items": items,
+            "embeddings": embeddings,
+            "tokens": [estimate_tokens(item) for item in items],
+            "importance": np.array([
+                item.get("importance", 0) if isinstance(item, dict) else 0 for item in items
+            ], dtype=np.float32),
+        }
+
+    def select(self, query, groups=None, token_budget=None):
+        """Return {group: [items]} holding the best-scoring entries that fit the budget.
+
+        Every group gets its single best entry first (if it fits), then the rest of
+        the budget goes to the highest scores across all groups.
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        names = [g for g in (groups or self.groups) if g in self.groups and self.groups[g]["items"]]
+        query_vec = self._encode([query])[0] if query and query.strip() else None
+
+        ranked = []
+        for name in names:
+            group = self.groups[name]
+            relevance = np.asarray(group["embeddings"]) @ query_vec if query_vec is not None else np.zeros(len(group["items"]))
+            scores = relevance + self.IMPORTANCE_WEIGHT * group["importance"]
+            # Stable sort keeps file order among ties, which is what an empty query falls back to.
+            order = np.argsort(-scores, kind="stable")
+            ranked.append((name, [(float(scores[i]), int(i)) for i in order]))
+
+        chosen = {name: [] for name in names}
+        used = 0
+        for name, entries in ranked:
+            score, i = entries[0]
+            cost = self.groups[name]["tokens"][i]
+            if used + cost <= budget:
+                chosen[name].append((score, i))
+                used += cost
+
+        rest = sorted(
+            ((score, name, i) for name, entries in ranked for score, i in entries[1:]),
+            key=lambda e: -e[0]
+        )
+        for score, name, i in rest:
+            cost = self.groups[name]["tokens"][i]
+            if used + cost <= budget:
+                chosen[name].append((score, i))
+                used += cost
+
+        return {
+            name: [self.groups[name]["items"][i] for _, i in sorted(picks, key=lambda p: -p[0])]
+            for name, picks in chosen.items()
+        }
@@ -0,0 +1,71 @@
+import numpy as np
+
+
+class MetadataIndex:
+    """Inverted index from normalized metadata values to song ids.
+
+    Posting lists are Python ints used as bitsets (bit i set = song i), so
+    combining filters is a handful of integer ORs/ANDs no matter how many
+    songs are loaded. Terms still match by substring, as the old linear scan
+    did, but only against the distinct values of a field rather than every song.
+    """
+
+    FIELDS = ("tone", "tags", "theme", "structure")
+
+    def __init__(self, fields=FIELDS):
+        self.fields = tuple(fields)
+        self.postings = {field: {} for field in self.fields}
+        self.all_bits = 0
+        self._term_cache = {}
+
+    def add(self, song_id, song):
+        bit = 1 << song_id
+        for field, value in self._normalized_values(song):
+            postings = self.postings[field]
+            postings[value] = postings.get(value, 0) | bit
+        self.all_bits |= bit
+        self._term_cache.clear()
+
+    def remove(self, song_id, song):
+        mask = ~(1 << song_id)
+        for field, value in self._normalized_values(song):
+            postings = self.postings[field]
+            if value in postings:
+                postings[value] &= mask
+                if not postings[value]:
+                    del postings[value]
+        self.all_bits &= mask
+        self._term_cache.clear()
+
+    def match(self, field, terms):
+        """Bitset of songs whose `field` contains any of `terms`."""
+        bits = 0
+        for term in terms:
+            key = (field, term)
+            if key not in self._term_cache:
+                self._term_cache[key] = self._match_term(field, term)
+            bits |= self._term_cache[key]
+        return bits
+
+    def _match_term(self, field, term):
+        bits = 0
+        for value, postings in self.postings[field].items():
+            if term in value:
+                bits |= postings
+        return bits
+
+    def _normalized_values(self, song):
+        for field in self.fields:
+            value = song.get(field)
+            if isinstance(value, str):
+                yield field, value.lower()
+            elif isinstance(value, list):
+                for item in value:
+                    yield field, str(item).lower()
+
+    @staticmethod
+    def ids(bits):
+        if not bits:
+            return np.empty(0, dtype=np.int64)
+        raw = np.frombuffer(bits.to_bytes((bits.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+        return np.flatnonzero(np.unpackbits(raw, bitorder="little")).astype(np.int64)
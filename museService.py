@@ -1,26 +1,77 @@
 import json
 import os
 import re
-import ollama
+import llmClient
 from composerService import ShantyComposerService
+from loreContextSelector import LoreContextSelector, estimate_tokens
 
 class MuseService:
-    def __init__(self, legends_path='legends2.json', ship_path='ship.json', facts_path='shantyfacts.json', locations_path='locations.json'):
+    SHIP_DETAIL_GROUPS = ("masts", "sails", "devices", "quirks", "past_voyages")
+
+    def __init__(self, legends_path='legends2.json', ship_path='ship.json', facts_path='shantyfacts.json', locations_path='locations.json', context_token_budget=1200, encoder=None, encoder_backend="torch"):
         with open(ship_path, 'r', encoding='utf-8') as f:
             self.ship = json.load(f)
         with open(facts_path, 'r', encoding='utf-8') as f:
             self.facts = json.load(f)
         with open(locations_path, 'r', encoding='utf-8') as f:
             self.locations = json.load(f)
+        self.legends = []
         if os.path.exists(legends_path):
             with open(legends_path, 'r', encoding='utf-8') as f:
                 self.legends = json.load(f)
 
+        # None sends every lore file in full, as before.
+        self.context_token_budget = context_token_budget
+        self.encoder = encoder
+        self.encoder_backend = encoder_backend
+        self._selector = None
+
+    @property
+    def selector(self):
+        if self._selector is None:
+            selector = LoreContextSelector(encoder=self.encoder, token_budget=self.context_token_budget, encoder_backend=self.encoder_backend)
+            ship = self.ship.get("ship", {})
+            selector.add_group("locations", self.locations)
+            selector.add_group("facts", self.facts)
+            selector.add_group("legends", self.legends)
+            selector.add_group("crew", self.ship.get("crew", []))
+            for group in self.SHIP_DETAIL_GROUPS:
+                selector.add_group(group, ship.get(group, []))
+            self._selector = selector
+        return self._selector
+
+    def _ship_core(self):
+        ship = self.ship.get("ship", {})
+        core = {k: v for k, v in ship.items() if k not in self.SHIP_DETAIL_GROUPS}
+        return {"aliases": self.ship.get("aliases", []), "ship": core}
+
+    def _select_context(self, query, groups, reserved_tokens=0):
+        """Most relevant lore for `query`, within whatever budget is left after `reserved_tokens`."""
+        budget = max(self.context_token_budget - reserved_tokens, 0)
+        return self.selector.select(query, groups=groups, token_budget=budget)
+
+    def _environment_query(self, environment):
+        parts = []
+        for key, value in environment.items():
+            if value in (None, [], ""):
+                continue
+            if isinstance(value, list):
+                value = ", ".join(str(v) for v in value)
+            parts.append(f"{key.replace('_', ' ')}: {value}")
+        return ". ".join(parts)
+
     def generate_ballad_prompt(self, model="mistral"):
-        input_data = {
-            "locations": self.locations,
-            "ship": self.legends
-        }
+        if self.context_token_budget is None:
+            input_data = {
+                "locations": self.locations,
+                "ship": self.legends
+            }
+        else:
+            selected = self._select_context("legends and history of the lake, its people and ships", ["locations", "legends"])
+            input_data = {
+                "locations": selected.get("locations", []),
+                "ship": selected.get("legends", [])
+            }
         json_expected= (            "{\n"
             "  \"crew_mood\": string,\n"
             "  \"song_tone\": string,\n"
@@ -55,7 +106,7 @@ class MuseService:
             "The muse_spark must draw on a legend."
         )
 
-        response = ollama.chat(
+        response = llmClient.chat(
             model=model,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -78,18 +129,32 @@ class MuseService:
 
 
     def generate_shanty_prompt(self, model="mistral", temperature=None, wind_speed=None, time_of_day=None, sightings=None, crew_mood=None):
-        input_data = {
-            "locations": self.locations,
-            "ship": self.ship,
-            "facts": sorted(self.facts, key=lambda f: -f["importance"]),
-            "environment": {
-                "temperature": temperature,
-                "wind_speed": wind_speed,
-                "time_of_day": time_of_day,
-                "sightings": sightings or [],
-                "crew_mood": crew_mood
-            }
+        environment = {
+            "temperature": temperature,
+            "wind_speed": wind_speed,
+            "time_of_day": time_of_day,
+            "sightings": sightings or [],
+            "crew_mood": crew_mood
         }
+        if self.context_token_budget is None:
+            input_data = {
+                "locations": self.locations,
+                "ship": self.ship,
+                "facts": sorted(self.facts, key=lambda f: -f["importance"]),
+                "environment": environment
+            }
+        else:
+            groups = ["locations", "facts", "crew", *self.SHIP_DETAIL_GROUPS]
+            ship = self._ship_core()
+            selected = self._select_context(self._environment_query(environment), groups, estimate_tokens(ship))
+            ship["ship"].update({group: selected.get(group, []) for group in self.SHIP_DETAIL_GROUPS})
+            ship["crew"] = selected.get("crew", [])
+            input_data = {
+                "locations": selected.get("locations", []),
+                "ship": ship,
+                "facts": sorted(selected.get("facts", []), key=lambda f: -f["importance"]),
+                "environment": environment
+            }
         json_expected= (            "{\n"
             "  \"crew_mood\": string,\n"
             "  \"song_tone\": string,\n"
@@ -130,7 +195,7 @@ class MuseService:
             "The muse_spark may draw on a legend, a historical ship fact, or a cultural note about shanties."
         )
 
-        response = ollama.chat(
+        response = llmClient.chat(
             model=model,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -1,95 +1,273 @@
+import asyncio
 import os
 import json
 import re
-from jinja2 import Template
-from shipsCarpenterService import QuarterMasterService
-import ollama
+from concurrent.futures import ThreadPoolExecutor
+from embeddingCache import content_hash
+from evaluationMemo import EvaluationMemo
+from evaluationScheduler import EvaluationDAG, load_registry
+from preprocessorService import SemanticPreprocessorService, annotation_key, current_annotation
+from promptAssembly import default_assembler
+from songNovelty import SongNoveltyEvaluator
+from songUtils import definition_hash, song_hash, song_lyrics
+from structuralScorer import StructuralScorer
+import llmClient
 
 class EvaluationAgentService:
-    def __init__(self, evaluator_path="evaluators", model="mistral"):
-        self.quarterMasterService = QuarterMasterService()
+    def __init__(self, evaluator_path="evaluators", model="mistral", max_concurrency=4, evaluator_timeout=180, options=None, prescreen_threshold=0.6,
+                 preprocessor_dir="pre-processors", registry_path="registries/evaluator_registry.json", providers=None,
+                 repository=None, memo_path="evaluation_memo.db", llm_threads=16):
         self.evaluator_path = evaluator_path
         self.model = model
+        # Judges should be repeatable; greedy decoding also makes their answers cacheable.
+        self.options = options if options is not None else {"temperature": 0}
+        self.prompts = default_assembler
+        self.max_concurrency = max_concurrency
+        self.evaluator_timeout = evaluator_timeout
+        # LLM calls run on their own bounded pool, shared by concurrent evaluate() calls. wait_for can't stop a
+        # call that timed out, so it lingers here until the client gives up instead of piling up in the default executor.
+        self.llm_executor = ThreadPoolExecutor(max_workers=llm_threads, thread_name_prefix="evaluator-llm")
         self.evaluators = self._load_evaluators()
+        # None disables the structural gate and sends every song straight to the LLM evaluators.
+        self.prescreen = StructuralScorer(threshold=prescreen_threshold) if prescreen_threshold is not None else None
+        # Local (non-LLM) engines compare against the composer's repository. Without one they are skipped:
+        # loading a repository (and its encoder) just to review a song is far too slow.
+        self.repository = repository
+        self._novelty = None
+        self.engines = {"novelty": self._novelty_score}
+        providers = dict({"similar_songs": lambda song: self.novelty.similar_songs(song) if self.novelty else []}, **(providers or {}))
+        self.preprocessor = SemanticPreprocessorService(preprocessor_dir, model=model) if preprocessor_dir and os.path.isdir(preprocessor_dir) else None
+        # Evaluators, the preprocessors they rely on and their data form one graph, built once.
+        self.dag = EvaluationDAG(
+            self.evaluators,
+            self.preprocessor.preprocessors if self.preprocessor else [],
+            load_registry(registry_path),
+            providers
+        )
+        # Stored results per (song, evaluator version, model); None re-asks the LLM every time.
+        self.memo = EvaluationMemo(memo_path) if memo_path else None
+
+    @property
+    def novelty(self):
+        if self._novelty is None and self.repository is not None:
+            self._novelty = SongNoveltyEvaluator(self.repository)
+        return self._novelty
+
+    def _novelty_score(self, song):
+        if self.novelty is None:
+            return {"skipped": "No song repository to compare against"}
+        return self.novelty.evaluate(song)
 
     def _load_evaluators(self):
         evaluators = []
-        for fname in os.listdir(self.evaluator_path):
+        for fname in sorted(os.listdir(self.evaluator_path)):
             if fname.endswith(".json"):
                 with open(os.path.join(self.evaluator_path, fname), 'r', encoding='utf-8') as f:
                     evaluators.append(json.load(f))
         return evaluators
 
     def resolve_dependency(self, key):
-        if key == "ship_data":
-            return {
-                "title": "Ship Data",
-                "content": self.quarterMasterService.getShipJson()
-            }
-        elif key == "nautical_terminology":
-            with open("data/nautical_terms.json", "r", encoding="utf-8") as f:
-                return {
-                    "title": "Nautical Terminology",
-                    "content": json.load(f)
-                }
-        else:
-            return {
-                "title": key,
-                "content": f"[Missing data for dependency: {key}]"
-            }
+        return self.prompts.dependency(key)
 
     def evaluate(self, song):
-        results = []
+        """Synchronous evaluate_async, for threads without an event loop. Async callers await evaluate_async."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.evaluate_async(song))
+        raise RuntimeError("evaluate() was called from a running event loop; await evaluate_async(song) instead")
 
-        for evaluator in self.evaluators:
-            # Inject context based on dependencies
-            evaluator["context"] = []
-            for dep in evaluator.get("dependencies", []):
-                evaluator["context"].append(self.resolve_dependency(dep))
-
-            template = Template(evaluator["template"])
-            prompt = template.render(
-                agent=evaluator.get("agent", "Evaluator"),
-                song_title=song.get("title", "Untitled"),
-                lyrics=song.get("lines", "")
-            )
-
-            system_prompt = self.build_system_prompt(evaluator)
-
-            response = ollama.chat(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-
-            raw_output = response['message']['content']
-
-            try:
-                json_match = re.search(r'{.*}', raw_output, re.DOTALL)
-                result = json.loads(json_match.group()) if json_match else {"error": "No JSON found"}
-            except Exception as e:
-                result = {"error": f"Failed to parse: {e}", "raw": raw_output}
+    async def evaluate_async(self, song):
+        """Run the evaluator graph; results keep the evaluator order.
 
+        Evaluators start as soon as the preprocessors and data they depend on are
+        ready, and are skipped when a preprocessor says they aren't needed. The
+        structural pre-screen's result comes first. Songs it rejects never reach
+        an LLM; their evaluators are reported as skipped. LLM evaluators whose
+        result is in the memo for this song, version and model reuse it.
+        """
+        results = []
+        if self.prescreen is not None:
+            screen = self.prescreen.score(song)
             results.append({
-                "evaluator": evaluator.get("name"),
-                "description": evaluator.get("description"),
-                "score": result
+                "evaluator": "Structural Pre-screen",
+                "description": "Deterministic checks of line lengths, chorus repetition and vocabulary.",
+                "score": screen
             })
+            if screen["rejected"]:
+                print(f"🚫 Pre-screen rejected {song.get('title', 'Untitled')}: {'; '.join(screen['reasons'])}")
+                return results + [{
+                    "evaluator": evaluator.get("name"),
+                    "description": evaluator.get("description"),
+                    "score": {"skipped": "Rejected by the structural pre-screen"}
+                } for evaluator in self.evaluators]
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        key = song_hash(song)
+        outputs, versions, tasks = {}, {}, {}
+        memoized = set()
+
+        def need(node):
+            # Nodes start when something waits on them, so a preprocessor whose evaluators were all memoized never runs.
+            if node not in tasks:
+                tasks[node] = asyncio.ensure_future(run(node))
+            return tasks[node]
+
+        async def run(node):
+            kind, spec = self.dag.nodes[node]["kind"], self.dag.nodes[node]["spec"]
+            deps = self.dag.nodes[node]["deps"]
+            if kind == "evaluator" and not spec.get("engine"):
+                # Data and providers are cheap and part of the version; preprocessors are awaited only on a memo miss.
+                await asyncio.gather(*(need(dep) for dep in deps if self.dag.nodes[dep]["kind"] != "preprocessor"))
+                versions[node] = self.evaluator_version(node, outputs)
+                cached = await asyncio.to_thread(self.memo.get, key, versions[node], self.model) if self.memo else None
+                if cached is not None:
+                    outputs[node] = cached
+                    memoized.add(node)
+                    return
+            await asyncio.gather(*(need(dep) for dep in deps))
+            if kind == "data":
+                # Resolved once per run, however many evaluators read it.
+                outputs[node] = (await asyncio.to_thread(self.prompts.dependency, spec))["content"]
+                return
+            if kind == "provider":
+                outputs[node] = await asyncio.to_thread(self.dag.providers[spec], song)
+                return
+            if kind == "evaluator":
+                reason = self.dag.skip_reason(node, outputs)
+                if reason:
+                    outputs[node] = {"skipped": reason}
+                    return
+                if spec.get("engine"):
+                    # Local engines take milliseconds; they don't need an LLM slot.
+                    try:
+                        outputs[node] = await asyncio.to_thread(self.engines[spec["engine"]], song)
+                    except Exception as e:
+                        outputs[node] = {"error": f"Evaluator failed: {e}"}
+                    return
+            async with semaphore:
+                try:
+                    loop = asyncio.get_running_loop()
+                    if kind == "preprocessor":
+                        call = loop.run_in_executor(self.llm_executor, self._run_preprocessor, spec, song)
+                    else:
+                        call = loop.run_in_executor(self.llm_executor, self._run_evaluator, spec, song, self.dag.context(node, outputs))
+                    outputs[node] = await asyncio.wait_for(call, timeout=self.evaluator_timeout)
+                except asyncio.TimeoutError:
+                    outputs[node] = {"error": f"Timed out after {self.evaluator_timeout}s"}
+                except Exception as e:
+                    outputs[node] = {"error": f"Evaluator failed: {e}"}
+            if kind == "evaluator" and self.memo and "error" not in outputs[node]:
+                await asyncio.to_thread(self.memo.put, key, versions[node], self.model, spec.get("name"), outputs[node])
+
+        # Every node waits only on its own dependencies, so independent branches overlap.
+        await asyncio.gather(*(need(node) for node in self.dag.evaluator_nodes))
+
+        entries = []
+        for node in self.dag.evaluator_nodes:
+            entry = {
+                "evaluator": self.dag.nodes[node]["spec"].get("name"),
+                "description": self.dag.nodes[node]["spec"].get("description"),
+                "score": outputs[node]
+            }
+            if node in versions:
+                # Which prompt and model produced the score, so later reviews can tell stale ones apart.
+                entry.update(version=versions[node][:12], model=self.model, memoized=node in memoized)
+            entries.append(entry)
+        return results + entries
+
+    def evaluator_version(self, node, outputs):
+        """Hash of everything but the song that shapes an LLM evaluator's prompt.
+
+        Covers the merged definition (template, description, dependencies,
+        run_if), the decoding options, the content of data and provider
+        dependencies in `outputs`, and the versions of the preprocessors it
+        waits on.
+        """
+        parts = [definition_hash(self.dag.nodes[node]["spec"]), json.dumps(self.options, sort_keys=True)]
+        for dep in self.dag.nodes[node]["deps"]:
+            upstream = self.dag.nodes[dep]
+            if upstream["kind"] == "preprocessor":
+                parts.append(f"{dep}={upstream['spec']['_version']}")
+            else:
+                parts.append(f"{dep}={content_hash(json.dumps(outputs.get(dep), sort_keys=True, ensure_ascii=False, default=str))}")
+        return content_hash("\n".join(parts))
+
+    def plan(self, song):
+        """What evaluate(song) would do, without calling an LLM: {node: action}.
+
+        Evaluators are "memo" (stored result reused), "call", "skip" (rejected
+        by the pre-screen, or a cached annotation says they aren't needed),
+        "local" (a non-LLM engine) or "maybe" (a call unless an uncached
+        preprocessor says otherwise). Preprocessors appear as "call" when a
+        memo miss would make them run.
+        """
+        if self.prescreen is not None and self.prescreen.score(song)["rejected"]:
+            return {node: "skip" for node in self.dag.evaluator_nodes}
+        key = song_hash(song)
+        outputs, actions = {}, {}
+        for node in self.dag.order:
+            kind, spec = self.dag.nodes[node]["kind"], self.dag.nodes[node]["spec"]
+            if kind == "data":
+                outputs[node] = self.prompts.dependency(spec)["content"]
+            elif kind == "provider":
+                outputs[node] = self.dag.providers[spec](song)
+            elif kind == "preprocessor":
+                outputs[node] = current_annotation(song, spec)
+            elif spec.get("engine"):
+                actions[node] = "local"
+            elif self.memo and self.memo.get(key, self.evaluator_version(node, outputs), self.model) is not None:
+                actions[node] = "memo"
+            else:
+                pending = [dep for dep in self.dag.nodes[node]["deps"] if self.dag.nodes[dep]["kind"] == "preprocessor" and outputs.get(dep) is None]
+                actions.update((dep, "call") for dep in pending)
+                if self.dag.skip_reason(node, outputs):
+                    actions[node] = "skip"
+                elif pending and spec.get("run_if"):
+                    actions[node] = "maybe"
+                else:
+                    actions[node] = "call"
+        return actions
+
+    def _run_preprocessor(self, preprocessor, song):
+        """Semantic metadata for `song`, reusing an annotation already made by the current preprocessor version."""
+        current = current_annotation(song, preprocessor)
+        if current is not None:
+            return current
+        name, version = preprocessor["_file"], preprocessor["_version"]
+        result = self.preprocessor._apply_preprocessor(song, preprocessor)
+        if "error" not in result:
+            song.setdefault("semantic_metadata", {})[name] = dict(result, _version=version, _song=annotation_key(song)[:12])
+        return result
+
+    def _run_evaluator(self, evaluator, song, context=None):
+        prompt = self.prompts.template(evaluator["template"]).render(
+            agent=evaluator.get("agent", "Evaluator"),
+            song_title=song.get("title", "Untitled"),
+            lyrics=song_lyrics(song),
+            **(context or {})
+        )
+
+        system_prompt = self.build_system_prompt(evaluator)
+
+        response = llmClient.chat(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            options=self.options
+        )
+
+        raw_output = response['message']['content']
 
-        return results
+        try:
+            json_match = re.search(r'{.*}', raw_output, re.DOTALL)
+            return json.loads(json_match.group()) if json_match else {"error": "No JSON found"}
+        except Exception as e:
+            return {"error": f"Failed to parse: {e}", "raw": raw_output}
 
     def build_system_prompt(self, evaluator) -> str:
-        name = evaluator.get("name", "Evaluator")
-        desc = evaluator.get("description", "You evaluate songs.")
-        intro = f"You are {name}. {desc}\n\n"
-
-        context_sections = ""
-        for c in evaluator.get("context", []):
-            label = c.get("title", "Context")
-            content = c.get("content", "")
-            body = json.dumps(content, indent=2) if isinstance(content, (dict, list)) else str(content)
-            context_sections += f"{label}:\n{body}\n\n"
-
-        return intro + context_sections + "Only respond with a JSON object."
+        # Provider outputs (e.g. similar_songs) reach the template directly, not the system prompt.
+        deps = [dep for dep in evaluator.get("dependencies", []) if dep not in self.dag.providers]
+        return self.prompts.system_prompt(dict(evaluator, dependencies=deps))
@@ -1,12 +1,39 @@
+import argparse
 import os
 import json
 import re
-import ollama
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import llmClient
+from songbookStore import SongbookStore
+from embeddingCache import content_hash
+from songUtils import definition_hash, song_lyrics
+
+
+def annotation_key(song):
+    """Hash of everything a preprocessor prompt shows the model: title, context and lyrics."""
+    return content_hash(json.dumps([song.get("title"), song.get("context"), song_lyrics(song)], ensure_ascii=False))
+
+
+def current_annotation(song, preprocessor):
+    """The song's annotation by the current version of `preprocessor`, or None if it's missing or stale.
+
+    Annotations carry the preprocessor `_version` and the `_song` key of the
+    title, context and lyrics they describe; older ones without `_song` are
+    taken on trust.
+    """
+    current = (song.get("semantic_metadata") or {}).get(preprocessor["_file"])
+    if not isinstance(current, dict) or current.get("_version") != preprocessor["_version"]:
+        return None
+    key = annotation_key(song)[:12]
+    if current.get("_song", key) != key:
+        return None
+    return current
 
 class SemanticPreprocessorService:
-    def __init__(self, preprocessor_dir="pre-processors", model="mistral"):
+    def __init__(self, preprocessor_dir="pre-processors", model="mistral", options=None):
         self.preprocessor_dir = preprocessor_dir
         self.model = model
+        self.options = options if options is not None else {"temperature": 0}
         self.preprocessors = self._load_preprocessors()
 
     def _load_preprocessors(self):
@@ -17,6 +44,7 @@ class SemanticPreprocessorService:
                 with open(path, "r", encoding="utf-8") as f:
                     data = json.load(f)
                     data["_file"] = os.path.splitext(file)[0]
+                    data["_version"] = str(data.get("version") or definition_hash(data)[:12])
                     loaded.append(data)
         return loaded
 
@@ -37,18 +65,22 @@ class SemanticPreprocessorService:
             f"{instructions}\n\n"
             f"Title: {song.get('title')}\n"
             f"Context: {song.get('context')}\n"
-            f"Lyrics:\n{song.get('lines')}"
+            f"Lyrics:\n{song_lyrics(song)}"
         )
 
         system_prompt = f"You are {name}. Only return a JSON object in this format:\n{output_format}"
 
-        response = ollama.chat(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ]
-        )
+        try:
+            response = llmClient.chat(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                options=self.options
+            )
+        except Exception as e:
+            return {"error": f"LLM call failed: {e}"}
 
         try:
             raw = response["message"]["content"]
@@ -57,14 +89,113 @@ class SemanticPreprocessorService:
         except Exception as e:
             return {"error": str(e), "raw_response": response["message"]["content"]}
 
-    def annotate_songbook(self, songbook_path="shanty_songbook.json"):
-        with open(songbook_path, "r", encoding="utf-8") as f:
-            songs = json.load(f)
+    def annotate_songbook(self, songbook=None, checkpoint_path=None, workers=4):
+        """Annotate every song in the songbook with every preprocessor, resuming from a checkpoint.
 
+        Each finished (song, preprocessor) result is appended to a JSONL checkpoint
+        as soon as it arrives, so a crash or Ctrl-C loses at most the calls in flight.
+        Songs whose semantic_metadata already carries the current preprocessor
+        version are skipped. Annotated songs are written back to the SongbookStore.
+        """
+        songbook = songbook or SongbookStore()
+        checkpoint_path = checkpoint_path or songbook.db_path + ".annotations.jsonl"
+        songs = songbook.query()
+        done = self._load_checkpoint(checkpoint_path)
+        tasks = {}
         for song in songs:
-            song["semantic_metadata"] = self.process_song(song)
+            key = annotation_key(song)
+            for preprocessor in self.preprocessors:
+                name, version = preprocessor["_file"], preprocessor["_version"]
+                if current_annotation(song, preprocessor) is not None:
+                    continue
+                if done.get((key, name), {}).get("version") == version:
+                    continue
+                tasks.setdefault((key, name), (song, preprocessor))
+
+        print(f"🧭 {len(tasks)} annotations to run, {len(done)} restored from checkpoint.")
+        interrupted = False
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {
+                pool.submit(self._apply_preprocessor, song, preprocessor): (key, preprocessor)
+                for (key, _), (song, preprocessor) in tasks.items()
+            }
+            with open(checkpoint_path, "a", encoding="utf-8") as log:
+                for future in as_completed(futures):
+                    key, preprocessor = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"error": str(e)}
+                    if "error" in result:
+                        # Leave failures out of the checkpoint so the next run retries them.
+                        print(f"⚠️ {preprocessor['_file']} failed: {result['error']}")
+                        continue
+                    record = {
+                        "song": key,
+                        "preprocessor": preprocessor["_file"],
+                        "version": preprocessor["_version"],
+                        "result": dict(result, _version=preprocessor["_version"], _song=key[:12])
+                    }
+                    log.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    log.flush()
+                    done[(key, record["preprocessor"])] = record
+        except KeyboardInterrupt:
+            interrupted = True
+            print("\n⚓ Interrupted; saving finished annotations. Run again to resume.")
+        finally:
+            pool.shutdown(wait=not interrupted, cancel_futures=True)
+
+        annotated = 0
+        for song in songs:
+            before = json.dumps(song.get("semantic_metadata"), sort_keys=True)
+            annotated += self._merge_annotations([song], done)
+            if json.dumps(song.get("semantic_metadata"), sort_keys=True) != before:
+                songbook.update(song["_songbook_id"], song)
+
+        if not interrupted and annotated == len(songs) and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        print(f"✅ Semantic metadata current for {annotated} of {len(songs)} songs.")
+
+    def _merge_annotations(self, songs, done):
+        annotated = 0
+        for song in songs:
+            key = annotation_key(song)
+            metadata = song.setdefault("semantic_metadata", {})
+            for preprocessor in self.preprocessors:
+                name, version = preprocessor["_file"], preprocessor["_version"]
+                record = done.get((key, name))
+                if record and record["version"] == version:
+                    metadata[name] = record["result"]
+            if all(current_annotation(song, p) is not None for p in self.preprocessors):
+                annotated += 1
+        return annotated
+
+    def _load_checkpoint(self, checkpoint_path):
+        done = {}
+        if not os.path.exists(checkpoint_path):
+            return done
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line from a hard crash; everything before it is still good.
+                continue
+            done[(record["song"], record["preprocessor"])] = record
+        if lines and not lines[-1].endswith("\n"):
+            # Terminate the torn line so new records don't get glued onto it.
+            with open(checkpoint_path, "a", encoding="utf-8") as f:
+                f.write("\n")
+        return done
+
 
-        with open(songbook_path, "w", encoding="utf-8") as f:
-            json.dump(songs, f, indent=2)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Annotate the songbook with every semantic preprocessor.")
+    parser.add_argument("--db", default="shanty_songbook.db")
+    parser.add_argument("--model", default="mistral")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
 
-        print(f"✅ Semantic metadata added for {len(songs)} songs.")
+    SemanticPreprocessorService(model=args.model).annotate_songbook(SongbookStore(args.db), workers=args.workers)
@@ -1,12 +1,9 @@
-import json
-import os
 from preprocessorService import SemanticPreprocessorService
+from songbookStore import SongbookStore
 
-# Load one song from shanty_songbook.json
-def load_first_song(songbook_path="shanty_songbook.json"):
-    with open(songbook_path, "r", encoding="utf-8") as f:
-        songs = json.load(f)
-    return songs[0]  # Get the first song
+# Load the first song from the songbook database
+def load_first_song(db_path="shanty_songbook.db"):
+    return SongbookStore(db_path).query(limit=1)[0]
 
 def run_test():
     # Initialize the evaluation service
@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+from jinja2 import Template
+
+
+class PromptAssembler:
+    """Compiles prompt templates and renders lore blocks once, reusing them until a source file changes.
+
+    Everything handed out is a str (or a compiled template), so callers can't
+    mutate shared state, and identical system prompts stay byte-for-byte
+    identical across requests.
+    """
+
+    DEPENDENCY_SOURCES = {
+        "ship_data": ("Ship Data", "ship.json"),
+        "nautical_terminology": ("Nautical Terminology", "data/nautical_terms.json"),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._files = {}
+        self._rendered = {}
+
+    def template(self, source):
+        compiled = self._templates.get(source)
+        if compiled is None:
+            compiled = Template(source)
+            with self._lock:
+                self._templates[source] = compiled
+        return compiled
+
+    def load_json(self, path):
+        """Parsed JSON for `path`, re-read only when its mtime changes. Treat the result as read-only."""
+        mtime = os.path.getmtime(path)
+        cached = self._files.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        with self._lock:
+            self._files[path] = (mtime, data)
+        return data
+
+    def dependency(self, key):
+        title, path = self.DEPENDENCY_SOURCES.get(key, (key, key if key.endswith(".json") else None))
+        if path and os.path.exists(path):
+            return {"title": title, "content": self.load_json(path)}
+        return {"title": key, "content": f"[Missing data for dependency: {key}]"}
+
+    def dependency_block(self, key):
+        return self._memo(("dependency", key), self._source_stamp(key), lambda: self._render_block(self.dependency(key)))
+
+    def system_prompt(self, evaluator):
+        name = evaluator.get("name", "Evaluator")
+        desc = evaluator.get("description", "You evaluate songs.")
+        deps = tuple(evaluator.get("dependencies", []))
+        stamp = (desc,) + tuple(self._source_stamp(dep) for dep in deps)
+        return self._memo(
+            ("system", name, deps), stamp,
+            lambda: f"You are {name}. {desc}\n\n" + "".join(self.dependency_block(dep) for dep in deps) + "Only respond with a JSON object."
+        )
+
+    def ship_context(self, path="ship.json"):
+        return self._memo(("ship_context", path), os.path.getmtime(path), lambda: self._format_ship_context(self.load_json(path)))
+
+    def _format_ship_context(self, ship_data):
+        crew = ship_data.get("crew", [])
+        ship = ship_data.get("ship", {})
+
+        # Crew descriptions
+        crew_descriptions = "\n".join([
+            f"{c['name']} ({c['role']}): {c['description']} Personality: {c['personality']}."
+            for c in crew
+        ])
+
+        # Devices and automation
+        devices = ship.get("devices", [])
+        device_descriptions = "\n".join([
+            f"- {d['device']} ({d['location']}): {d['purpose']}" for d in devices
+        ])
+
+        # Ship description
+        ship_summary = f"The ship is named the *{ship.get('name')}*, a {ship.get('build')} with {ship.get('total_sails', '?')} sails. It is {ship.get('length_inches')} inches long. " \
+                    f"Legend says: \"{ship.get('legend', 'She carries songs through the fog.')}\" " \
+                    f"\n\nQuirks: {', '.join(ship.get('quirks', []))}"
+
+        # Full lore context
+        return f"Here is the ship's context:\n{ship_summary}\n\n" \
+            f"⚙️ Devices and Automation:\n{device_descriptions}\n\n" \
+            f"🧠 Crew of agentic AI:\n{crew_descriptions}\n\n"
+
+    def _render_block(self, dep):
+        content = dep.get("content", "")
+        body = json.dumps(content, indent=2) if isinstance(content, (dict, list)) else str(content)
+        return f"{dep.get('title', 'Context')}:\n{body}\n\n"
+
+    def _source_stamp(self, key):
+        _, path = self.DEPENDENCY_SOURCES.get(key, (key, key if key.endswith(".json") else None))
+        if path and os.path.exists(path):
+            return os.path.getmtime(path)
+        return None
+
+    def _memo(self, key, stamp, build):
+        cached = self._rendered.get(key)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        value = build()
+        with self._lock:
+            self._rendered[key] = (stamp, value)
+        return value
+
+
+default_assembler = PromptAssembler()
@@ -0,0 +1,107 @@
+import argparse
+import json
+import sys
+import urllib.error
+import urllib.request
+from weaverDefaults import DEFAULT_HOST, DEFAULT_PORT
+
+
+class ShantyClient:
+    """Thin client for a running shantyWeaverDaemon."""
+
+    def __init__(self, url=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", timeout=900):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _call(self, path, body=None):
+        data = None if body is None else json.dumps(body).encode("utf-8")
+        request = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.load(e).get("error")
+            except ValueError:
+                message = e.reason
+            raise RuntimeError(f"{e.code}: {message}") from None
+
+    def health(self):
+        return self._call("/health")
+
+    def muse(self, model=None, ballad=False, **environment):
+        body = {"ballad": ballad, "environment": environment}
+        if model:
+            body["model"] = model
+        return self._call("/muse", body)
+
+    def compose(self, muse_prompt=None, model=None, evaluate=False, best_of=1, **environment):
+        body = {"muse_prompt": muse_prompt, "evaluate": evaluate, "best_of": best_of, "environment": environment}
+        if model:
+            body["model"] = model
+        return self._call("/compose", body)
+
+    def evaluate(self, song=None, songbook_id=None):
+        return self._call("/evaluate", {"song": song, "songbook_id": songbook_id})
+
+    def search(self, text, k=3, tone=None, theme=None, structure=None):
+        return self._call("/search", {"text": text, "k": k, "tone": tone, "theme": theme, "structure": structure})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Talk to a running Shanty Weaver daemon.")
+    parser.add_argument("--url", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("health")
+
+    compose = commands.add_parser("compose")
+    compose.add_argument("--model")
+    compose.add_argument("--muse-prompt", help="path to a muse prompt JSON file (default: ask the muse)")
+    compose.add_argument("--evaluate", action="store_true")
+    compose.add_argument("--best-of", type=int, default=1, help="compose this many candidates concurrently and keep the best")
+    compose.add_argument("--wind-speed")
+    compose.add_argument("--time-of-day")
+    compose.add_argument("--crew-mood")
+    compose.add_argument("--sighting", action="append", dest="sightings")
+
+    evaluate = commands.add_parser("evaluate")
+    evaluate.add_argument("--song", help="path to a song JSON file")
+    evaluate.add_argument("--songbook-id", type=int)
+
+    search = commands.add_parser("search")
+    search.add_argument("text")
+    search.add_argument("-k", type=int, default=3)
+    search.add_argument("--tone")
+    search.add_argument("--theme")
+    search.add_argument("--structure")
+
+    args = parser.parse_args()
+    client = ShantyClient(args.url)
+
+    def load(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    try:
+        if args.command == "health":
+            result = client.health()
+        elif args.command == "compose":
+            environment = {
+                key: value for key, value in {
+                    "wind_speed": args.wind_speed,
+                    "time_of_day": args.time_of_day,
+                    "crew_mood": args.crew_mood,
+                    "sightings": args.sightings,
+                }.items() if value
+            }
+            muse_prompt = load(args.muse_prompt) if args.muse_prompt else None
+            result = client.compose(muse_prompt, model=args.model, evaluate=args.evaluate, best_of=args.best_of, **environment)
+        elif args.command == "evaluate":
+            result = client.evaluate(load(args.song) if args.song else None, args.songbook_id)
+        else:
+            result = client.search(args.text, args.k, args.tone, args.theme, args.structure)
+    except (RuntimeError, urllib.error.URLError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
@@ -0,0 +1,179 @@
+import argparse
+import json
+import queue
+import random
+import threading
+import time
+from encoders import ENCODER_BACKENDS
+from museService import MuseService
+from composerService import ShantyComposerService
+from philosopherService import EvaluationAgentService
+
+_DONE = object()
+
+
+class _Stage:
+    """A pool of worker threads between two bounded queues.
+
+    A full output queue blocks the workers (backpressure); the last worker to
+    finish forwards one end marker per downstream worker.
+    """
+
+    def __init__(self, name, fn, workers, inbox, outbox, downstream_workers):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.inbox = inbox
+        self.outbox = outbox
+        self.downstream_workers = downstream_workers
+        self.busy_seconds = 0.0
+        self.processed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._running = workers
+        self.threads = [
+            threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                break
+            started = time.perf_counter()
+            try:
+                result = self.fn(item)
+            except Exception as e:
+                print(f"❌ {self.name} failed: {e}")
+                result = None
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.busy_seconds += elapsed
+                if result is None:
+                    self.failed += 1
+                else:
+                    self.processed += 1
+            if result is not None:
+                self.outbox.put(result)
+
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last:
+            for _ in range(self.downstream_workers):
+                self.outbox.put(_DONE)
+
+
+class ShantyPipeline:
+    """Muse → compose → evaluate as overlapping stages joined by bounded queues."""
+
+    def __init__(self, muse=None, composer=None, evaluator=None, model="mistral",
+                 muse_workers=1, compose_workers=1, evaluate_workers=1, queue_size=2, ballad_ratio=0.0):
+        self.composer = composer or ShantyComposerService()
+        self.muse = muse or MuseService(encoder=self.composer.songRepository.encoder)
+        self.evaluator = evaluator or EvaluationAgentService(model=model, repository=self.composer.songRepository)
+        self.model = model
+        self.muse_workers = muse_workers
+        self.compose_workers = compose_workers
+        self.evaluate_workers = evaluate_workers
+        self.queue_size = queue_size
+        self.ballad_ratio = ballad_ratio
+
+    def run(self, count):
+        jobs = queue.Queue()
+        prompts = queue.Queue(maxsize=self.queue_size)
+        songs = queue.Queue(maxsize=self.queue_size)
+        reviewed = queue.Queue()
+        for i in range(count):
+            jobs.put(i)
+        for _ in range(self.muse_workers):
+            jobs.put(_DONE)
+
+        stages = [
+            _Stage("muse", self._muse, self.muse_workers, jobs, prompts, self.compose_workers),
+            _Stage("compose", self._compose, self.compose_workers, prompts, songs, self.evaluate_workers),
+            _Stage("evaluate", self._evaluate, self.evaluate_workers, songs, reviewed, 1),
+        ]
+
+        started = time.perf_counter()
+        for stage in stages:
+            stage.start()
+
+        results = []
+        while True:
+            item = reviewed.get()
+            if item is _DONE:
+                break
+            results.append(item)
+            print(f"🎶 {len(results)} reviewed: {item['song'].get('title')}")
+        for stage in stages:
+            stage.join()
+        wall = time.perf_counter() - started
+
+        return {"results": results, "report": self._report(stages, wall, len(results), count)}
+
+    def _muse(self, _):
+        if random.random() < self.ballad_ratio:
+            return self.muse.generate_ballad_prompt(model=self.model)
+        return self.muse.generate_shanty_prompt(model=self.model)
+
+    def _compose(self, prompt):
+        song_id, song = self.composer.compose_entry(prompt, model=self.model)
+        return {"songbook_id": song_id, "song": song} if song else None
+
+    def _evaluate(self, entry):
+        evaluations = self.evaluator.evaluate(entry["song"])
+        self.composer.songbook.update(entry["songbook_id"], dict(entry["song"], evaluations=evaluations))
+        return dict(entry, evaluations=evaluations)
+
+    def _report(self, stages, wall, completed, requested):
+        return {
+            "requested": requested,
+            "completed": completed,
+            "wall_seconds": round(wall, 2),
+            "songs_per_hour": round(completed / wall * 3600, 2) if wall > 0 else 0.0,
+            "stages": {
+                stage.name: {
+                    "workers": stage.workers,
+                    "processed": stage.processed,
+                    "failed": stage.failed,
+                    "busy_seconds": round(stage.busy_seconds, 2),
+                    "utilization": round(stage.busy_seconds / (wall * stage.workers), 3) if wall > 0 else 0.0,
+                }
+                for stage in stages
+            },
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate and review a batch of shanties in one pipelined run.")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--model", default="mistral")
+    parser.add_argument("--muse-workers", type=int, default=1)
+    parser.add_argument("--compose-workers", type=int, default=2)
+    parser.add_argument("--evaluate-workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=2)
+    parser.add_argument("--ballad-ratio", type=float, default=0.0)
+    parser.add_argument("--encoder-backend", choices=ENCODER_BACKENDS, default="torch")
+    args = parser.parse_args()
+
+    pipeline = ShantyPipeline(
+        composer=ShantyComposerService(encoder_backend=args.encoder_backend),
+        model=args.model,
+        muse_workers=args.muse_workers,
+        compose_workers=args.compose_workers,
+        evaluate_workers=args.evaluate_workers,
+        queue_size=args.queue_size,
+        ballad_ratio=args.ballad_ratio,
+    )
+    outcome = pipeline.run(args.count)
+    print(json.dumps(outcome["report"], indent=2))
@@ -0,0 +1,253 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from encoders import ENCODER_BACKENDS
+from museService import MuseService
+from composerService import ShantyComposerService
+from philosopherService import EvaluationAgentService
+from weaverDefaults import DEFAULT_HOST, DEFAULT_PORT, ENVIRONMENT_KEYS
+
+
+class QueueFull(Exception):
+    pass
+
+
+class BadRequest(Exception):
+    """Something wrong with the request itself; the only error the daemon answers with a 400."""
+
+
+def int_field(body, name, default=None):
+    try:
+        return int(body[name]) if body.get(name) is not None else default
+    except (TypeError, ValueError):
+        raise BadRequest(f"{name} must be an integer, got {body[name]!r}")
+
+
+class RequestQueue:
+    """Admits at most `max_concurrency` jobs at once, lets `max_waiting` wait, and turns the rest away."""
+
+    def __init__(self, max_concurrency=2, max_waiting=16):
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.served = 0
+        self.rejected = 0
+
+    def run(self, fn, *args, **kwargs):
+        """Returns (result, seconds queued, seconds working)."""
+        with self._lock:
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise QueueFull(f"{self.waiting} requests already waiting")
+            self.waiting += 1
+        queued_at = time.perf_counter()
+        self._slots.acquire()
+        started = time.perf_counter()
+        with self._lock:
+            self.waiting -= 1
+            self.active += 1
+        try:
+            return fn(*args, **kwargs), started - queued_at, time.perf_counter() - started
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.served += 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "active": self.active,
+                "waiting": self.waiting,
+                "served": self.served,
+                "rejected": self.rejected,
+            }
+
+
+class ShantyWeaverDaemon:
+    """Keeps the repository, lore and services loaded so each request only pays for its own work."""
+
+    def __init__(self, model="mistral", max_concurrency=2, max_waiting=16, encoder_backend="torch",
+                 muse=None, composer=None, evaluator=None):
+        started = time.perf_counter()
+        self.model = model
+        self.composer = composer or ShantyComposerService(encoder_backend=encoder_backend)
+        # The lore selector shares the repository's encoder: one model in memory, and its encodes batch with searches.
+        self.muse = muse or MuseService(encoder=self.composer.songRepository.encoder)
+        self.evaluator = evaluator or EvaluationAgentService(model=model, repository=self.composer.songRepository)
+        self.queue = RequestQueue(max_concurrency, max_waiting)
+        self._warm_up()
+        self.started_at = time.time()
+        print(f"⚓ Shanty Weaver ready in {time.perf_counter() - started:.1f}s")
+
+    def _warm_up(self):
+        # Load the encoder and embed the lore now rather than on the first request.
+        self.composer.songRepository.encoder.encode(["warm up"])
+        if self.muse.context_token_budget is not None:
+            self.muse.selector
+
+    def muse_prompt(self, body):
+        model = body.get("model", self.model)
+        if body.get("ballad"):
+            return self.muse.generate_ballad_prompt(model=model)
+        environment = body.get("environment") or {}
+        if not isinstance(environment, dict):
+            raise BadRequest("environment must be a JSON object")
+        unknown = sorted(set(environment) - set(ENVIRONMENT_KEYS))
+        if unknown:
+            raise BadRequest(f"Unknown environment field(s): {', '.join(unknown)}; expected {', '.join(ENVIRONMENT_KEYS)}")
+        return self.muse.generate_shanty_prompt(model=model, **environment)
+
+    def compose(self, body):
+        muse_prompt = body.get("muse_prompt") or self.muse_prompt(body)
+        if not muse_prompt:
+            raise RuntimeError("The muse produced no prompt")
+        model = body.get("model", self.model)
+        best_of = int_field(body, "best_of", 1)
+        if best_of > 1:
+            # Candidates are evaluated as they finish, so the winner's evaluations come back with it.
+            outcome = self.composer.compose_best_of(
+                muse_prompt, model=model, n=best_of, evaluator=self.evaluator if body.get("evaluate") else None
+            )
+            if not outcome["song"]:
+                raise RuntimeError(f"None of {best_of} candidates produced a usable song")
+            result = {"muse_prompt": muse_prompt, "song": outcome["song"], "songbook_id": outcome["songbook_id"], "best_of": outcome["stats"]}
+            if outcome["evaluations"] is not None:
+                result["evaluations"] = outcome["evaluations"]
+            return result
+        song_id, song = self.composer.compose_entry(muse_prompt, model=model)
+        if not song:
+            raise RuntimeError("The composer produced no song")
+        result = {"muse_prompt": muse_prompt, "song": song, "songbook_id": song_id}
+        if body.get("evaluate"):
+            result["evaluations"] = self._evaluate_song(song, song_id)
+        return result
+
+    def evaluate(self, body):
+        song, song_id = body.get("song"), None
+        if song is None and body.get("songbook_id") is not None:
+            song_id = int_field(body, "songbook_id")
+            song = self.composer.songbook.get(song_id)
+            if song is None:
+                raise BadRequest(f"No songbook entry {song_id}")
+            song = {k: v for k, v in song.items() if not k.startswith("_")}
+        if not isinstance(song, dict):
+            raise BadRequest("Provide a song object or a songbook_id")
+        return {"song": song, "songbook_id": song_id, "evaluations": self._evaluate_song(song, song_id)}
+
+    def _evaluate_song(self, song, song_id=None):
+        evaluations = self.evaluator.evaluate(song)
+        if song_id is not None:
+            self.composer.songbook.update(song_id, dict(song, evaluations=evaluations))
+        return evaluations
+
+    def search(self, body):
+        if not body.get("text"):
+            raise BadRequest("search needs 'text'")
+        songs = self.composer.songRepository.search_by_prompt(
+            body["text"],
+            k=int_field(body, "k", 3),
+            tone=body.get("tone"),
+            theme=body.get("theme"),
+            structure=body.get("structure"),
+            add_random=bool(body.get("add_random", False)),
+        )
+        return {"songs": songs}
+
+    def health(self):
+        batcher = self.composer.songRepository.encode_batcher
+        return {
+            "status": "ok",
+            "model": self.model,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "songs_indexed": len(self.composer.songRepository.songs_by_id),
+            "queue": self.queue.stats(),
+            "encoder_batching": batcher.metrics() if batcher else None,
+        }
+
+    def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        server = ThreadingHTTPServer((host, port), make_handler(self))
+        server.daemon_threads = True
+        print(f"🌊 Listening on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("🛑 Shutting down")
+        finally:
+            server.server_close()
+
+
+def make_handler(daemon):
+    routes = {"/compose": daemon.compose, "/evaluate": daemon.evaluate, "/search": daemon.search, "/muse": daemon.muse_prompt}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, daemon.health())
+            else:
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            handler = routes.get(self.path)
+            if handler is None:
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(body, dict):
+                    raise ValueError("Request body must be a JSON object")
+            except ValueError as e:
+                self._reply(400, {"error": f"Bad request: {e}"})
+                return
+
+            try:
+                result, queued, worked = daemon.queue.run(handler, body)
+            except QueueFull as e:
+                self._reply(503, {"error": f"Busy: {e}"})
+                return
+            except BadRequest as e:
+                self._reply(400, {"error": f"Bad request: {e}"})
+                return
+            except Exception as e:
+                print(f"❌ {self.path} failed: {e}")
+                self._reply(500, {"error": str(e)})
+                return
+            self._reply(200, dict(result or {}, timing={"queued_seconds": round(queued, 3), "work_seconds": round(worked, 3)}))
+
+        def _reply(self, status, payload):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            print(f"📨 {self.address_string()} {format % args}")
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Shanty Weaver as a resident local service.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--model", default="mistral")
+    parser.add_argument("--max-concurrency", type=int, default=2, help="requests worked on at once")
+    parser.add_argument("--max-waiting", type=int, default=16, help="requests allowed to queue before 503s")
+    parser.add_argument("--encoder-backend", choices=ENCODER_BACKENDS, default="torch")
+    args = parser.parse_args()
+
+    ShantyWeaverDaemon(
+        model=args.model,
+        max_concurrency=args.max_concurrency,
+        max_waiting=args.max_waiting,
+        encoder_backend=args.encoder_backend,
+    ).serve(args.host, args.port)
@@ -1,5 +1,5 @@
 import json
-import ollama
+import llmClient
 from pathlib import Path
 
 class QuarterMasterService:
@@ -18,7 +18,7 @@ class QuarterMasterService:
             "Respond to all questions about the ship or crew conversationally, as if you were aboard the vessel. Be accurate, knowledgeable, and in-character.\n\n"
             f"Ship and Crew Data:\n{json.dumps(ship_data, indent=2)}"
         )
-        response = ollama.chat(
+        response = llmClient.chat(
             model="mistral",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -67,9 +67,10 @@ class QuarterMasterService:
             Only return a single JSON in this format.
             """
 
-        response = ollama.chat(
+        response = llmClient.chat(
             model=self.model,
-            messages=[{"role": "user", "content": prompt}]
+            messages=[{"role": "user", "content": prompt}],
+            options={"temperature": 0}
         )
 
         try:
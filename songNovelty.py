@@ -0,0 +1,192 @@
+import re
+import threading
+import time
+import zlib
+import numpy as np
+from songUtils import song_hash, song_lyrics
+
+_PRIME = np.uint64(4294967291)  # largest prime below 2**32
+
+
+def normalize_line(line):
+    return " ".join(re.findall(r"[a-z0-9']+", line.lower()))
+
+
+def shingles(line, size=4):
+    """Character n-grams of a normalized line; short lines are their own single shingle."""
+    if len(line) <= size:
+        return frozenset([line]) if line else frozenset()
+    return frozenset(line[i:i + size] for i in range(len(line) - size + 1))
+
+
+class LineShingleIndex:
+    """MinHash + LSH index over individual lyric lines.
+
+    Each line becomes a MinHash signature of its character shingles; signatures
+    are split into `bands` bands so near-duplicate lines collide in at least one
+    bucket. Candidates are then confirmed with the exact Jaccard of their shingles.
+    """
+
+    def __init__(self, num_perm=64, bands=16, seed=7):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2**31, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 2**31, num_perm, dtype=np.uint64)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.buckets = {}
+        self.lines = {}     # (song_id, line_no) -> shingle set
+        self.by_song = {}
+
+    def signature(self, shingle_set):
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+        return ((np.outer(hashes, self.a) + self.b) % _PRIME).min(axis=0)
+
+    def _band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def add(self, song_id, lines):
+        keys = []
+        for line_no, line in enumerate(lines):
+            shingle_set = shingles(line)
+            if not shingle_set:
+                continue
+            key = (song_id, line_no)
+            self.lines[key] = shingle_set
+            for band_key in self._band_keys(self.signature(shingle_set)):
+                self.buckets.setdefault(band_key, set()).add(key)
+            keys.append(key)
+        self.by_song[song_id] = keys
+
+    def remove(self, song_id):
+        for key in self.by_song.pop(song_id, []):
+            for band_key in self._band_keys(self.signature(self.lines.pop(key))):
+                bucket = self.buckets.get(band_key)
+                if bucket:
+                    bucket.discard(key)
+
+    def matches(self, line, threshold, exclude=()):
+        """[(song_id, line_no, jaccard)] for indexed lines at least `threshold` similar to `line`."""
+        shingle_set = shingles(line)
+        if not shingle_set:
+            return []
+        candidates = set()
+        for band_key in self._band_keys(self.signature(shingle_set)):
+            candidates |= self.buckets.get(band_key, set())
+        found = []
+        for song_id, line_no in candidates:
+            if song_id in exclude:
+                continue
+            other = self.lines[(song_id, line_no)]
+            jaccard = len(shingle_set & other) / len(shingle_set | other)
+            if jaccard >= threshold:
+                found.append((song_id, line_no, jaccard))
+        return found
+
+
+class SongNoveltyEvaluator:
+    """Scores how new a song is against the repository, with no LLM call.
+
+    Combines nearest-neighbour cosine similarity from the repository's own
+    embedding index with line-level copying found through a LineShingleIndex:
+    how many lines are near-copies and the longest run of consecutive copied
+    lines. Also supplies `similar_songs` for LLM evaluators that want them.
+    """
+
+    def __init__(self, repository, k=3, line_threshold=0.7, min_words=4, num_perm=64, bands=16):
+        self.repository = repository
+        self.k = k
+        self.line_threshold = line_threshold
+        # Short refrains ("Way hay!") are shared across half the tradition; they aren't copying.
+        self.min_words = min_words
+        self.line_index = LineShingleIndex(num_perm, bands)
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        """Mirror songs added to or removed from the repository since the last call."""
+        songs = self.repository.snapshot()
+        with self._lock:
+            for song_id in set(self._hashes) - set(songs):
+                self.line_index.remove(song_id)
+                del self._hashes[song_id]
+            for song_id in set(songs) - set(self._hashes):
+                song = songs[song_id]
+                self.line_index.add(song_id, self._lines(song))
+                self._hashes[song_id] = song_hash(song)
+        return songs
+
+    @staticmethod
+    def _lines(song):
+        # Blank lines between verses would otherwise break up a copied run.
+        return [line for line in (normalize_line(raw) for raw in song_lyrics(song).split("\n")) if line]
+
+    def _own_ids(self, song):
+        # A song already in the corpus (an approved songbook entry) shouldn't count as copying itself.
+        key = song_hash(song)
+        with self._lock:
+            return {song_id for song_id, h in self._hashes.items() if h == key}
+
+    def nearest(self, song, k=None):
+        """[(song_id, cosine similarity)] of the closest repository songs, excluding the song itself."""
+        return self._nearest(song, k)[0]
+
+    def _nearest(self, song, k=None):
+        # Also hands back the snapshot the ids were drawn from, so callers resolve them against the same songs.
+        k = k or self.k
+        songs = self._sync()
+        own = self._own_ids(song)
+        live = sorted(set(songs) - own)
+        if not live:
+            return [], songs
+        # Vectors are unit length, so squared L2 distance is 2 - 2·cosine.
+        found = self.repository.nearest_among(self.repository.encode_song(song), live, k)
+        return [(i, 1 - d / 2) for i, d in found if i in songs], songs
+
+    def similar_songs(self, song, k=None):
+        nearest, songs = self._nearest(song, k)
+        return [
+            {"title": songs[i].get("title"), "lines": song_lyrics(songs[i]), "similarity": round(sim, 3)}
+            for i, sim in nearest
+        ]
+
+    def evaluate(self, song):
+        started = time.perf_counter()
+        nearest, songs = self._nearest(song)
+        own = self._own_ids(song)
+
+        lines = self._lines(song)
+        eligible = [i for i, line in enumerate(lines) if len(line.split()) >= self.min_words]
+        copied = set()
+        pairs = {}
+        with self._lock:
+            for i in eligible:
+                for song_id, line_no, _ in self.line_index.matches(lines[i], self.line_threshold, exclude=own):
+                    copied.add(i)
+                    pairs.setdefault(song_id, set()).add((i, line_no))
+
+        # Longest stretch of consecutive lines copied from consecutive lines of one song.
+        longest, longest_song = 0, None
+        for song_id, matched in pairs.items():
+            run = {}
+            for i, j in sorted(matched):
+                run[(i, j)] = run.get((i - 1, j - 1), 0) + 1
+                if run[(i, j)] > longest:
+                    longest, longest_song = run[(i, j)], song_id
+
+        max_similarity = max((sim for _, sim in nearest), default=0.0)
+        copied_fraction = len(copied) / len(eligible) if eligible else 0.0
+        semantic = float(np.clip((0.9 - max_similarity) / 0.4, 0.0, 1.0))
+        run_factor = max(0.0, 1 - max(longest - 1, 0) / 4)
+        novelty = (0.5 * semantic + 0.5 * (1 - copied_fraction)) * run_factor
+
+        return {
+            "score": round(1 + 4 * novelty, 1),
+            "novelty": round(novelty, 3),
+            "max_similarity": round(max_similarity, 3),
+            "nearest": [{"title": songs[i].get("title"), "similarity": round(sim, 3)} for i, sim in nearest],
+            "copied_lines": len(copied),
+            "longest_copied_run": {"lines": longest, "from": songs[longest_song].get("title") if longest_song in songs else None},
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
@@ -1,113 +1,376 @@
 import json
+import os
+import threading
 import faiss
 import random
-from functools import lru_cache
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
+from embeddingBatcher import EmbeddingBatcher
+from embeddingCache import EmbeddingCache, content_hash
+from encoders import encoder_cache_key, load_encoder
+from metadataIndex import MetadataIndex
+from songUtils import song_lyrics
+from vectorIndex import STORAGE_DTYPES, build_index, index_bytes, load_index, make_index_config, save_index, search_params, supports_removal
+
+class SharedEncoder:
+    """Duck-types an encoder from encoders.py on top of a repository's batched encode."""
+
+    def __init__(self, encode_fn, cache_key):
+        self.encode_fn = encode_fn
+        self.cache_key = cache_key
+
+    def encode(self, texts, normalize_embeddings=True):
+        # The repository always normalizes.
+        return self.encode_fn(list(texts))
+
 
 class ShantyRepository:
-    def __init__(self, json_path="shanties.json"):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.songs = self._load_json(json_path)
-        self.documents = [s["title"] + ": " + s["lines"] for s in self.songs]
-        self.embeddings = self.model.encode(self.documents, normalize_embeddings=True)
-        self.index = faiss.IndexFlatL2(self.embeddings[0].shape[0])
-        self.index.add(self.embeddings)
+    EXPANSION_TOP_K = 5
+    EXPANSION_THRESHOLD = 0.5
+    EXPANSION_SAVE_EVERY = 64
+    OOV_CACHE_SIZE = 1024
+
+    def __init__(self, json_path="shanties.json", model_name="all-MiniLM-L6-v2", cache_dir=".embedding_cache", index_config=None, encoder_backend="torch",
+                 encode_batch_size=64, encode_window_ms=2.0):
+        self.model_name = model_name
+        self.encoder_backend = encoder_backend
+        # Vectors from different backends are cached (and indexed) separately.
+        self.encoder_key = encoder_cache_key(model_name, encoder_backend)
+        self.index_config = make_index_config(index_config)
+        self._model = None
+        # Concurrent searches share batched encoder calls; a window of None turns batching off.
+        self.encode_batcher = EmbeddingBatcher(self._encode_now, encode_batch_size, encode_window_ms) if encode_window_ms is not None else None
+        # Quantized configs store the on-disk vectors at the same precision the index keeps them.
+        storage_dtype = STORAGE_DTYPES[self.index_config["quantization"]]
+        self.embedding_cache = EmbeddingCache(self._encode, self.encoder_key, cache_dir, dtype=storage_dtype)
+        self._lock = threading.RLock()
+        self.songs_by_id = {}
+        self._songbook_ids = {}
+        self._songbook_revision = None
+        self._next_id = 0
+
+        seed_songs = self._load_json(json_path)
+        documents = [self._document(s) for s in seed_songs]
+        embeddings = self.embedding_cache.encode(documents)
+        self.metadata_index = MetadataIndex()
+        seed_ids = self._register(seed_songs)
+        self.index = self._load_or_build_index(documents, embeddings, seed_ids)
 
         # Build vocabulary from metadata
         self.vocab = self._build_vocab()
-        self.vocab_embeddings = self.model.encode(self.vocab, normalize_embeddings=True)
+        self.vocab_embeddings = self.embedding_cache.encode(self.vocab)
+        self._unsaved_terms = 0
+        self.expansions = self._load_expansion_table()
+        self._oov_expansions = {}
 
-    def search_by_prompt(self, text, k=3, tone=None, theme=None, structure=None, add_random=True, threshold=0.8):
-        filtered_songs = self._search_by_any_match(self.songs, tone=tone, theme=theme, structure=structure)
-        if not filtered_songs:
-            filtered_songs = random.choices(self.songs, k=k)
+    @property
+    def songs(self):
+        return list(self.songs_by_id.values())
+
+    @property
+    def model(self):
+        # Only load the encoder when something actually needs encoding.
+        if self._model is None:
+            self._model = load_encoder(self.encoder_backend, self.model_name)
+        return self._model
+
+    @property
+    def encoder(self):
+        """This repository's encoder, batched, for other components (like the lore selector) to share."""
+        return SharedEncoder(self._encode, self.encoder_key)
 
-        docs = [s["title"] + ": " + s["lines"] for s in filtered_songs]
-        embeddings = self.model.encode(docs, normalize_embeddings=True)
-        query_vec = self.model.encode([text], normalize_embeddings=True)
+    def _encode(self, texts):
+        if self.encode_batcher is None:
+            return self._encode_now(texts)
+        return self.encode_batcher.encode(texts)
 
-        similarities = cosine_similarity(query_vec, embeddings)[0]
-        top_k_indices = similarities.argsort()[-k:][::-1]
-        top_results = [filtered_songs[i] for i in top_k_indices]
+    def _encode_now(self, texts):
+        return self.model.encode(texts, normalize_embeddings=True)
+
+    def search_by_prompt(self, text, k=3, tone=None, theme=None, structure=None, add_random=True, threshold=0.8):
+        raw = {"tone": self._split_terms(tone), "theme": self._split_terms(theme), "structure": self._split_terms(structure)}
+        terms = [t for values in raw.values() for t in values]
+        # Encode the prompt and any unseen filter terms together, before taking the lock, so concurrent searches share batches.
+        unknown = self._unknown_terms(terms)
+        vectors = self._encode([text] + unknown)
+        query_vec = vectors[:1]
+        expanded = self._expand_semantically(terms, dict(zip(unknown, vectors[1:])))
+        with self._lock:
+            candidate_ids = self._search_by_any_match(raw, expanded)
+            if len(candidate_ids) == 0:
+                candidate_ids = np.array(sorted(set(random.choices(list(self.songs_by_id), k=k))), dtype=np.int64)
+
+            # Score only the filtered songs, straight from the prebuilt index.
+            params = search_params(self.index, self.index_config, faiss.IDSelectorBatch(candidate_ids))
+            _, ids = self.index.search(query_vec, min(k, len(candidate_ids)), params=params)
+            top_results = [self.songs_by_id[i] for i in ids[0] if i >= 0]
+            songs = self.songs
 
         random_count = k - len(top_results) if len(top_results) < k else 1
         if add_random:
-            candidates = [s for s in self.songs if s not in top_results]
+            candidates = [s for s in songs if s not in top_results]
             if candidates:
                 extras = random.sample(candidates, k=min(random_count, len(candidates)))
                 top_results.extend(extras)
 
         return top_results
 
-    def _build_vocab(self):
+    def _build_vocab(self, songs=None):
         vocab = set()
-        for song in self.songs:
+        for song in self.songs if songs is None else songs:
             for key in ["tone", "tags", "theme", "structure"]:
                 val = song.get(key)
                 if isinstance(val, str):
                     vocab.add(val.lower())
                 elif isinstance(val, list):
                     vocab.update(v.lower() for v in val if isinstance(v, str))
-        return list(vocab)
-
-    @lru_cache(maxsize=128)
-    def _expand_semantically_cached(self, term):
-        return tuple(self._expand_semantically(term))
-
-    def _expand_semantically(self, term, top_k=5, threshold=0.5):
-        query_embedding = self.model.encode([term], normalize_embeddings=True)
-        similarities = cosine_similarity(query_embedding, self.vocab_embeddings)[0]
-        results = [
-            self.vocab[i]
-            for i, score in enumerate(similarities)
-            if score >= threshold and self.vocab[i] != term
-        ]
-        return results[:top_k]
-
-    def _search_by_any_match(self, songs, tone=None, theme=None, structure=None):
-        tone_matches = self._fuzzy_filter(songs, "tone", tone) if tone else []
-        tag_matches = self._fuzzy_filter(songs, "tags", tone) if tone else []
-        theme_matches = self._fuzzy_filter(songs, "theme", theme) if theme else []
-        structure_matches = self._fuzzy_filter(songs, "structure", structure) if structure else []
-
-        combined_results = tone_matches + tag_matches + theme_matches + structure_matches
-        return self._dedup(combined_results) if combined_results else songs
-
-    def _fuzzy_filter(self, songs, key, values):
+        return sorted(vocab)
+
+    def _expansion_key(self):
+        return {"model": self.encoder_key, "top_k": self.EXPANSION_TOP_K, "threshold": self.EXPANSION_THRESHOLD}
+
+    def _load_expansion_table(self):
+        path = self.embedding_cache.sidecar_path("expansions.json")
+        saved_vocab = []
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # A table saved for a smaller vocabulary (songs added since the last save) is topped up, not rebuilt.
+            if data.get("key") == self._expansion_key() and set(data.get("vocab", [])) <= set(self.vocab):
+                saved_vocab = data["vocab"]
+                expansions = {term: tuple(neighbours) for term, neighbours in data["expansions"].items()}
+        if saved_vocab:
+            known = set(saved_vocab)
+            new_terms = [t for t in self.vocab if t not in known]
+            if not new_terms:
+                return expansions
+            self._add_vocab_neighbours(expansions, new_terms)
+        else:
+            # The vocabulary is closed, so every term's neighbours come out of one matrix product.
+            expansions = self._nearest_vocab(self.vocab, self.vocab_embeddings, self.vocab, self.vocab_embeddings)
+        self._save_expansion_table(expansions)
+        return expansions
+
+    def _save_expansion_table(self, expansions):
+        path = self.embedding_cache.sidecar_path("expansions.json")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"key": self._expansion_key(), "vocab": self.vocab, "expansions": expansions}, f)
+        os.replace(path + ".tmp", path)
+        self._unsaved_terms = 0
+
+    def _add_vocab_neighbours(self, expansions, new_terms):
+        """Fold `new_terms` (already in self.vocab) into `expansions` in place, scoring only the new rows and columns."""
+        position = {term: i for i, term in enumerate(self.vocab)}
+        vocab_embeddings = np.asarray(self.vocab_embeddings)
+        new_embeddings = vocab_embeddings[[position[t] for t in new_terms]]
+        # Existing terms can only gain new terms as neighbours, so each keeps its old list merged with those.
+        new_scores = vocab_embeddings @ new_embeddings.T
+        for term, neighbours in list(expansions.items()):
+            row = new_scores[position[term]]
+            if row.max() < self.EXPANSION_THRESHOLD:
+                continue
+            scored = [(float(vocab_embeddings[position[n]] @ vocab_embeddings[position[term]]), position[n], n) for n in neighbours]
+            scored += [(float(score), position[n], n) for n, score in zip(new_terms, row) if score >= self.EXPANSION_THRESHOLD]
+            scored.sort(key=lambda item: (-item[0], item[1]))
+            expansions[term] = tuple(n for _, _, n in scored[:self.EXPANSION_TOP_K])
+        expansions.update(self._nearest_vocab(new_terms, new_embeddings, self.vocab, vocab_embeddings))
+
+    def _nearest_vocab(self, terms, term_embeddings, vocab, vocab_embeddings):
+        scores = np.asarray(term_embeddings) @ np.asarray(vocab_embeddings).T
+        results = {}
+        for term, row in zip(terms, scores):
+            best = np.argsort(-row)[:self.EXPANSION_TOP_K + 1]
+            neighbours = [
+                vocab[i]
+                for i in best
+                if row[i] >= self.EXPANSION_THRESHOLD and vocab[i] != term
+            ]
+            results[term] = tuple(neighbours[:self.EXPANSION_TOP_K])
+        return results
+
+    def _unknown_terms(self, terms):
+        expansions, oov = self.expansions, self._oov_expansions
+        return [t for t in dict.fromkeys(terms) if t not in expansions and t not in oov]
+
+    def _expand_semantically(self, terms, encoded=None):
+        """Map each term to its vocabulary neighbours, encoding only unseen terms, in one batch.
+
+        `encoded` holds vectors the caller already has for some of the terms.
+        Call without the lock held, so the encode can batch with other threads'.
+
+        Safe to call concurrently: results are built from this call's own lookups,
+        and the shared OOV cache is only ever swapped or extended under the lock.
+        """
+        with self._lock:
+            expansions, oov, vocab, vocab_embeddings = self.expansions, self._oov_expansions, self.vocab, self.vocab_embeddings
+        unknown = [t for t in dict.fromkeys(terms) if t not in expansions and t not in oov]
+        encoded = dict(encoded or {})
+        missing = [t for t in unknown if t not in encoded]
+        if missing:
+            encoded.update(zip(missing, self._encode(missing)))
+        fresh = self._nearest_vocab(unknown, np.asarray([encoded[t] for t in unknown]), vocab, vocab_embeddings) if unknown else {}
+        if fresh:
+            with self._lock:
+                if len(self._oov_expansions) + len(fresh) > self.OOV_CACHE_SIZE:
+                    # Swap rather than clear, so a concurrent caller still reading the old dict keeps its entries.
+                    self._oov_expansions = {}
+                self._oov_expansions.update(fresh)
+        return {
+            t: expansions[t] if t in expansions else fresh[t] if t in fresh else oov[t]
+            for t in terms
+        }
+
+    def _search_by_any_match(self, raw, expanded):
+        """Ids of songs matching any of the `raw` filter terms or their `expanded` neighbours."""
+        def with_neighbours(terms):
+            return set(terms).union(*(expanded[t] for t in terms))
+
+        matches = 0
+        if raw["tone"]:
+            tone_terms = with_neighbours(raw["tone"])
+            matches |= self.metadata_index.match("tone", tone_terms)
+            matches |= self.metadata_index.match("tags", tone_terms)
+        if raw["theme"]:
+            matches |= self.metadata_index.match("theme", with_neighbours(raw["theme"]))
+        if raw["structure"]:
+            matches |= self.metadata_index.match("structure", with_neighbours(raw["structure"]))
+
+        return MetadataIndex.ids(matches or self.metadata_index.all_bits)
+
+    @staticmethod
+    def _split_terms(values):
         if not values:
-            return songs
-
-        raw_terms = [v.strip().lower() for v in values.split(",") if v.strip()]
-        terms = set()
-        for term in raw_terms:
-            terms.add(term)
-            terms.update(self._expand_semantically_cached(term))
-
-        filtered = []
-        for song in songs:
-            field = song.get(key, "")
-            if isinstance(field, str):
-                if any(term in field.lower() for term in terms):
-                    filtered.append(song)
-            elif isinstance(field, list):
-                if any(term in str(item).lower() for term in terms for item in field):
-                    filtered.append(song)
-        return filtered
-
-    def _dedup(self, songs):
-        seen = set()
-        unique = []
-        for song in songs:
-            hashable_items = tuple(
-                (k, tuple(v) if isinstance(v, list) else v)
-                for k, v in sorted(song.items())
-            )
-            if hashable_items not in seen:
-                seen.add(hashable_items)
-                unique.append(song)
-        return unique
+            return []
+        return [v.strip().lower() for v in values.split(",") if v.strip()]
+
+    def add_song(self, song):
+        return self.add_songs([song])[0]
+
+    def snapshot(self):
+        """A consistent copy of {song_id: song}, safe to use while other threads add or remove songs."""
+        with self._lock:
+            return dict(self.songs_by_id)
+
+    def encode_song(self, song):
+        """The song's embedding exactly as the index stores it, shape (1, dim)."""
+        return np.asarray(self._encode([self._document(song)]), dtype=np.float32)
+
+    def nearest_among(self, query_vec, ids, k):
+        """[(song_id, squared L2 distance)] for the `k` songs among `ids` closest to `query_vec`."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return []
+        with self._lock:
+            params = search_params(self.index, self.index_config, faiss.IDSelectorBatch(ids))
+            distances, found = self.index.search(query_vec, min(k, len(ids)), params=params)
+        return [(int(i), float(d)) for d, i in zip(distances[0], found[0]) if i >= 0]
+
+    def add_songs(self, songs):
+        """Index new songs without a rebuild: one batched encode, then add_with_ids."""
+        if not songs:
+            return []
+        embeddings = self.embedding_cache.encode([self._document(s) for s in songs])
+        with self._lock:
+            song_ids = self._insert(songs, embeddings)
+            self._extend_vocab(songs)
+        return song_ids
+
+    def remove_song(self, song_id):
+        with self._lock:
+            song = self.songs_by_id.pop(song_id, None)
+            if song is None:
+                return False
+            if supports_removal(self.index_config):
+                self.index.remove_ids(np.array([song_id], dtype=np.int64))
+            # Otherwise the vector stays in the graph, but searches only ever select live ids.
+            self.metadata_index.remove(song_id, song)
+            return True
+
+    def sync_approved(self, songbook):
+        """Bring approved songbook songs into the inspiration corpus, and drop unapproved ones.
+
+        Only rows written since the last sync are read. The lock spans the diff
+        and the add, so concurrent composers can't ingest the same song twice.
+        """
+        with self._lock:
+            revision, changes = songbook.approval_changes(self._songbook_revision)
+            added = [song for book_id, approved, song in changes if approved and book_id not in self._songbook_ids]
+            removed = [book_id for book_id, approved, _ in changes if not approved and book_id in self._songbook_ids]
+
+            for book_id in removed:
+                self.remove_song(self._songbook_ids.pop(book_id))
+            for book_id, song_id in zip([s["_songbook_id"] for s in added], self.add_songs(added)):
+                self._songbook_ids[book_id] = song_id
+            self._songbook_revision = revision
+        if added or removed:
+            print(f"📚 Inspiration corpus: +{len(added)} / -{len(removed)} songbook songs.")
+        return len(added), len(removed)
+
+    def _insert(self, songs, embeddings):
+        song_ids = self._register(songs)
+        self.index.add_with_ids(np.asarray(embeddings, dtype=np.float32), np.array(song_ids, dtype=np.int64))
+        return song_ids
+
+    def _register(self, songs):
+        song_ids = list(range(self._next_id, self._next_id + len(songs)))
+        self._next_id += len(songs)
+        for song_id, song in zip(song_ids, songs):
+            self.songs_by_id[song_id] = song
+            self.metadata_index.add(song_id, song)
+        return song_ids
+
+    def _load_or_build_index(self, documents, embeddings, ids):
+        if self.index_config["kind"] == "flat" and not self.index_config["quantization"]:
+            index, _ = build_index(embeddings, ids, self.index_config)
+            return index
+
+        # Trained indexes are saved with their parameters so restarts skip training.
+        codec = self.index_config["quantization"] or ("pq" if self.index_config["pq_m"] else "")
+        path = self.embedding_cache.sidecar_path(f"{self.index_config['kind']}{codec}.faiss")
+        meta = {
+            "model": self.encoder_key,
+            "config": self.index_config,
+            "documents": content_hash("\n".join(documents)),
+        }
+        index = load_index(path, meta)
+        if index is None:
+            index, spec = build_index(embeddings, ids, self.index_config)
+            save_index(index, path, dict(meta, factory=spec))
+        return index
+
+    @staticmethod
+    def _document(song):
+        return song["title"] + ": " + song_lyrics(song)
+
+    def _extend_vocab(self, songs):
+        new_terms = sorted(set(self._build_vocab(songs)) - set(self.vocab))
+        if not new_terms:
+            return
+        # Keep the vocabulary sorted, exactly as a fresh build would order it.
+        terms = self.vocab + new_terms
+        embeddings = np.vstack([self.vocab_embeddings, self.embedding_cache.encode(new_terms)])
+        order = sorted(range(len(terms)), key=terms.__getitem__)
+        self.vocab = [terms[i] for i in order]
+        self.vocab_embeddings = embeddings[order]
+        expansions = dict(self.expansions)
+        self._add_vocab_neighbours(expansions, new_terms)
+        self.expansions = expansions
+        self._oov_expansions = {}
+        # Unsaved terms are cheap to top up on the next start, so the table is written in batches.
+        self._unsaved_terms += len(new_terms)
+        if self._unsaved_terms >= self.EXPANSION_SAVE_EVERY:
+            self._save_expansion_table(expansions)
+
+    def memory_footprint(self):
+        """Bytes held by the vector structures; the embedding store is memory-mapped, so it is reported separately."""
+        store = self.embedding_cache.vectors
+        return {
+            "quantization": self.index_config["quantization"] or "fp32",
+            "songs": len(self.songs_by_id),
+            "index_bytes": index_bytes(self.index),
+            "vocab_bytes": int(np.asarray(self.vocab_embeddings).nbytes),
+            "mapped_store_bytes": int(store.nbytes) if store is not None else 0,
+        }
 
     def get_random_songs(self, times=1):
         return random.choices(self.songs, k=times)
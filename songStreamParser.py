@@ -0,0 +1,213 @@
+import json
+
+
+class StreamingSongParser:
+    """Incremental parser for the composer's JSON song object.
+
+    Feed it completion chunks as they arrive. It hands back finished verses from
+    the "lyrics" value while the model is still writing, parses the whole object
+    once its closing brace arrives, and flags `diverged` as soon as the output
+    clearly isn't the song object we asked for.
+    """
+
+    EXPECTED_KEYS = {"title", "tone", "lyrics", "theme", "structure", "tags"}
+
+    def __init__(self, lines_per_verse=4, max_preamble=300, max_chars=8000, max_unknown_keys=2):
+        self.lines_per_verse = lines_per_verse
+        self.max_preamble = max_preamble
+        self.max_chars = max_chars
+        self.max_unknown_keys = max_unknown_keys
+        self._decoder = json.JSONDecoder(strict=False)
+
+        self.preamble = ""
+        self.buffer = ""
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.pending_key = None
+        self.current_key = None
+        self.expect_value = False
+        self.unknown_keys = 0
+        self.seen_keys = set()
+
+        self.lyrics_raw_start = None
+        self.lyrics_consumed = 0
+        self.lyrics_text = ""
+        self.verse = []
+        self.saw_blank_line = False
+
+        self.done = False
+        self.diverged = False
+        self.error = None
+        self.song = None
+
+    def feed(self, chunk):
+        verses = []
+        for ch in chunk:
+            if self.done or self.diverged:
+                break
+            self._consume(ch, verses)
+        if self.lyrics_raw_start is not None and not self.diverged:
+            self._drain_lyrics(verses, final=False)
+        return verses
+
+    def finish(self):
+        """Call when the stream ends; returns any verse still buffered."""
+        verses = []
+        if not self.done and not self.diverged:
+            self._diverge("Stream ended before the song object was closed")
+        if self.verse:
+            verses.append("\n".join(self.verse))
+            self.verse = []
+        return verses
+
+    def _consume(self, ch, verses):
+        if self.depth == 0:
+            if ch == "{":
+                self.depth = 1
+                self.buffer = ch
+            else:
+                self.preamble += ch
+                if len(self.preamble.strip().strip("`")) > self.max_preamble:
+                    self._diverge("Too much text before the JSON object")
+            return
+
+        self.buffer += ch
+        if len(self.buffer) > self.max_chars:
+            self._diverge("Song object exceeded the expected length")
+            return
+
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif ch == "\\":
+                self.escape = True
+            elif ch == '"':
+                self.in_string = False
+                self._end_string(verses)
+            return
+
+        if ch == '"':
+            self.in_string = True
+            self.string_start = len(self.buffer)
+            if self.depth == 1 and self.expect_value and self.current_key == "lyrics":
+                self.lyrics_raw_start = self.string_start
+                self.lyrics_consumed = self.string_start
+        elif ch == ":" and self.depth == 1:
+            self._start_value()
+        elif ch == "," and self.depth == 1:
+            self.expect_value = False
+            self.current_key = None
+        elif ch in "{[":
+            if self.depth == 1 and self.expect_value and self.current_key == "lyrics":
+                self._diverge("lyrics is not a string")
+                return
+            self.depth += 1
+        elif ch in "}]":
+            self.depth -= 1
+            if self.depth == 0:
+                self._close_object(verses)
+        elif not ch.isspace() and self.depth == 1 and self.expect_value and self.current_key == "lyrics":
+            self._diverge("lyrics is not a string")
+
+    def _start_value(self):
+        key = self.pending_key
+        self.pending_key = None
+        if key is None:
+            self._diverge("Malformed key in song object")
+            return
+        if key not in self.EXPECTED_KEYS:
+            self.unknown_keys += 1
+            if self.unknown_keys > self.max_unknown_keys:
+                self._diverge(f"Unexpected keys in song object (latest: {key!r})")
+                return
+        self.seen_keys.add(key)
+        self.current_key = key
+        self.expect_value = True
+
+    def _end_string(self, verses):
+        raw = self.buffer[self.string_start:-1]
+        if self.depth == 1 and not self.expect_value:
+            self.pending_key = self._decode_string(raw)
+        elif self.depth == 1 and self.current_key == "lyrics" and self.lyrics_raw_start is not None:
+            self._drain_lyrics(verses, final=True)
+            self.lyrics_raw_start = None
+
+    def _close_object(self, verses):
+        try:
+            self.song = self._decoder.decode(self.buffer)
+        except json.JSONDecodeError as e:
+            self._diverge(f"Invalid JSON: {e}")
+            return
+        if not isinstance(self.song.get("lyrics"), str):
+            self.song = None
+            self._diverge("Song object has no lyrics")
+            return
+        self.done = True
+        if self.verse:
+            verses.append("\n".join(self.verse))
+            self.verse = []
+
+    def _drain_lyrics(self, verses, final):
+        end = len(self.buffer) - 1 if final else self._safe_cut()
+        raw = self.buffer[self.lyrics_consumed:end]
+        self.lyrics_consumed = end
+        if raw:
+            text = self._decode_string(raw)
+            if text is None:
+                return
+            self.lyrics_text += text
+
+        # The prompt asks for literal "\n" separators, so fold those in with real newlines.
+        text = self.lyrics_text
+        hold = ""
+        if not final and text.endswith("\\"):
+            text, hold = text[:-1], "\\"
+        lines = text.replace("\\n", "\n").split("\n")
+        self.lyrics_text = lines.pop() + hold
+        if final and self.lyrics_text.strip():
+            lines.append(self.lyrics_text)
+            self.lyrics_text = ""
+
+        for line in lines:
+            line = line.strip()
+            if not line:
+                self.saw_blank_line = True
+                if self.verse:
+                    verses.append("\n".join(self.verse))
+                    self.verse = []
+                continue
+            self.verse.append(line)
+            if not self.saw_blank_line and len(self.verse) >= self.lines_per_verse:
+                verses.append("\n".join(self.verse))
+                self.verse = []
+
+    def _decode_string(self, raw):
+        # Models often write escapes JSON doesn't have, like \'; that's a divergence, not a crash.
+        try:
+            return self._decoder.decode(f'"{raw}"')
+        except json.JSONDecodeError as e:
+            self._diverge(f"Invalid string escape: {e}")
+            return None
+
+    def _safe_cut(self):
+        # Don't split an escape sequence across two decodes.
+        end = len(self.buffer)
+        slashes = 0
+        while end - slashes - 1 >= self.lyrics_consumed and self.buffer[end - slashes - 1] == "\\":
+            slashes += 1
+        if slashes % 2:
+            return end - 1
+        unicode_at = self.buffer.rfind("\\u", max(self.lyrics_consumed, end - 5), end)
+        if unicode_at != -1 and end - unicode_at < 6:
+            run = 0
+            while unicode_at - run >= self.lyrics_consumed and self.buffer[unicode_at - run] == "\\":
+                run += 1
+            if run % 2:
+                return unicode_at
+        return end
+
+    def _diverge(self, reason):
+        self.diverged = True
+        self.error = reason
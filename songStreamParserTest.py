@@ -0,0 +1,48 @@
+from songStreamParser import StreamingSongParser
+
+
+def feed_in_chunks(text, size=7):
+    parser = StreamingSongParser()
+    verses = []
+    for i in range(0, len(text), size):
+        verses += parser.feed(text[i:i + size])
+        if parser.done or parser.diverged:
+            break
+    if not parser.done and not parser.diverged:
+        verses += parser.finish()
+    return parser, verses
+
+
+def test_clean_song():
+    text = '{"title": "Fog", "tone": "calm", "lyrics": "We haul\\nWe heave\\nWe sing\\nWe sail\\n\\nAway we go", "tags": []}'
+    parser, verses = feed_in_chunks(text)
+    assert parser.done, parser.error
+    assert verses == ["We haul\nWe heave\nWe sing\nWe sail", "Away we go"], verses
+    print("✅ A clean song streams verse by verse")
+
+
+def test_invalid_escape_in_lyrics():
+    # \' isn't a JSON escape, but models write it all the time.
+    text = '{"title": "Fog", "tone": "calm", "lyrics": "The captain\\\'s call\\nWe heave away", "tags": []}'
+    parser, _ = feed_in_chunks(text)
+    assert parser.diverged and not parser.done, "Invalid escape in lyrics should diverge"
+    assert "escape" in parser.error, parser.error
+    print("✅ An invalid escape in the lyrics diverges instead of raising")
+
+
+def test_invalid_escape_in_key():
+    text = '{"title": "Fog", "cap\\\'n": "calm", "lyrics": "We heave away", "tags": []}'
+    parser, _ = feed_in_chunks(text)
+    assert parser.diverged and not parser.done, "Invalid escape in a key should diverge"
+    assert "escape" in parser.error, parser.error
+    print("✅ An invalid escape in a key diverges instead of raising")
+
+
+def run_test():
+    test_clean_song()
+    test_invalid_escape_in_lyrics()
+    test_invalid_escape_in_key()
+
+
+if __name__ == "__main__":
+    run_test()
@@ -0,0 +1,30 @@
+import json
+from embeddingCache import content_hash
+
+
+def song_lyrics(song):
+    # Older songbook entries still carry the raw "lyrics" field instead of "lines".
+    return song.get("lines") or song.get("lyrics", "").replace("\\n", "\n")
+
+
+def song_hash(song):
+    """Content hash of the parts of a song that reviewers actually read."""
+    return content_hash(json.dumps([song.get("title", ""), song_lyrics(song)], ensure_ascii=False))
+
+
+def definition_hash(definition):
+    """Hash of a preprocessor/evaluator JSON definition, ignoring loader bookkeeping keys."""
+    stable = {k: v for k, v in definition.items() if not k.startswith("_")}
+    return content_hash(json.dumps(stable, sort_keys=True, ensure_ascii=False))
+
+
+def mean_score(evaluations):
+    """Mean of the numeric scores in an evaluate() result list; 0.0 when there are none."""
+    scores = []
+    for evaluation in evaluations or []:
+        score = evaluation.get("score")
+        if isinstance(score, dict):
+            score = score.get("score")
+        if isinstance(score, (int, float)):
+            scores.append(score)
+    return sum(scores) / len(scores) if scores else 0.0
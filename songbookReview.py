@@ -0,0 +1,94 @@
+import argparse
+import json
+import time
+from philosopherService import EvaluationAgentService
+from songbookStore import SongbookStore
+
+
+class SongbookReview:
+    """Re-runs the evaluators over the songbook, calling the LLM only where the memo is stale.
+
+    An evaluator is asked again when its template, dependencies or the model
+    changed, or when a song's title or lyrics changed; everything else comes
+    from the evaluation memo. dry_run says what a review would cost first.
+    """
+
+    def __init__(self, evaluator=None, songbook=None, model="mistral"):
+        self.evaluator = evaluator or EvaluationAgentService(model=model)
+        self.songbook = songbook or SongbookStore()
+
+    def songs(self, tag=None, approved=None, limit=None):
+        return self.songbook.query(tag=tag, approved=approved, limit=limit)
+
+    def dry_run(self, songs):
+        """How many LLM calls reviewing `songs` would make, with and without the memo."""
+        started = time.perf_counter()
+        evaluators, preprocessors = {}, {}
+        llm_evaluators = [n for n in self.evaluator.dag.evaluator_nodes if not self.evaluator.dag.nodes[n]["spec"].get("engine")]
+        preprocessor_nodes = [n for n in self.evaluator.dag.order if self.evaluator.dag.nodes[n]["kind"] == "preprocessor"]
+        screened = 0
+        for song in songs:
+            actions = self.evaluator.plan(song)
+            if all(actions.get(node) == "skip" for node in self.evaluator.dag.evaluator_nodes):
+                screened += 1
+            for node, action in actions.items():
+                name = self._name(node)
+                tally = (preprocessors if node in preprocessor_nodes else evaluators).setdefault(name, {})
+                tally[action] = tally.get(action, 0) + 1
+
+        calls = sum(t.get("call", 0) for t in evaluators.values()) + sum(t.get("call", 0) for t in preprocessors.values())
+        maybe = sum(t.get("maybe", 0) for t in evaluators.values())
+        reviewed = len(songs) - screened
+        return {
+            "songs": len(songs),
+            "rejected_by_prescreen": screened,
+            "llm_calls": calls,
+            "llm_calls_at_most": calls + maybe,
+            "llm_calls_without_memo": reviewed * (len(llm_evaluators) + len(preprocessor_nodes)),
+            "evaluators": evaluators,
+            "preprocessors": preprocessors,
+            "planning_seconds": round(time.perf_counter() - started, 2),
+        }
+
+    def run(self, songs):
+        """Evaluate `songs`, storing the results (with their versions) back into the songbook."""
+        started = time.perf_counter()
+        memoized = fresh = 0
+        for song in songs:
+            evaluations = self.evaluator.evaluate(song)
+            # evaluate() also records semantic_metadata on the song, so the next review can reuse it.
+            self.songbook.update(song["_songbook_id"], dict(song, evaluations=evaluations))
+            reused = sum(1 for e in evaluations if e.get("memoized"))
+            asked = sum(1 for e in evaluations if "memoized" in e and not e["memoized"] and "skipped" not in e["score"])
+            memoized += reused
+            fresh += asked
+            print(f"🎵 {song.get('title', 'Untitled')}: {asked} evaluator(s) asked, {reused} reused")
+        return {
+            "songs": len(songs),
+            "evaluations_reused": memoized,
+            "evaluations_asked": fresh,
+            "wall_seconds": round(time.perf_counter() - started, 2),
+        }
+
+    def _name(self, node):
+        spec = self.evaluator.dag.nodes[node]["spec"]
+        return spec.get("name") or spec.get("_file") or node
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-review the songbook, reusing stored evaluations where nothing changed.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many LLM calls a review would make.")
+    parser.add_argument("--model", default="mistral")
+    parser.add_argument("--db", default="shanty_songbook.db")
+    parser.add_argument("--memo", default="evaluation_memo.db")
+    parser.add_argument("--tag")
+    parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    review = SongbookReview(
+        evaluator=EvaluationAgentService(model=args.model, memo_path=args.memo),
+        songbook=SongbookStore(args.db),
+    )
+    songs = review.songs(tag=args.tag, limit=args.limit)
+    report = review.dry_run(songs) if args.dry_run else review.run(songs)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+
+
+class SongbookStore:
+    """SQLite-backed songbook: O(1) atomic appends that are safe across processes.
+
+    Each song is stored whole as JSON, with the fields we filter on (tone,
+    created_at, approval, tags) pulled out into indexed columns. The old
+    shanty_songbook.json is imported the first time the database is created,
+    and export_json writes that format back out.
+    """
+
+    def __init__(self, db_path="shanty_songbook.db", legacy_json_path="shanty_songbook.json"):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS songs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    title TEXT,
+                    tone TEXT,
+                    created_at TEXT,
+                    approved INTEGER,
+                    data TEXT NOT NULL,
+                    -- Every write stamps the row with the next revision, so readers can ask for what changed since they last looked.
+                    revision INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS song_tags (
+                    song_id INTEGER NOT NULL REFERENCES songs(id) ON DELETE CASCADE,
+                    tag TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_songs_tone ON songs(tone);
+                CREATE INDEX IF NOT EXISTS idx_songs_created_at ON songs(created_at);
+                CREATE INDEX IF NOT EXISTS idx_songs_approved ON songs(approved);
+                CREATE INDEX IF NOT EXISTS idx_songs_revision ON songs(revision);
+                CREATE INDEX IF NOT EXISTS idx_song_tags_tag ON song_tags(tag, song_id);
+            """)
+        with self._connect() as conn:
+            # Holding the write lock from the start: a second process opening the same database
+            # (pipeline and daemon starting together) waits here and then finds the work done.
+            conn.execute("BEGIN IMMEDIATE")
+            count = self._import_legacy(conn, legacy_json_path)
+        if count:
+            print(f"📦 Imported {count} songs from {legacy_json_path} into {db_path}.")
+
+    def _import_legacy(self, conn, path):
+        """One-time import of the old JSON songbook, in the caller's transaction.
+
+        The meta row is written in the same transaction as the songs, so a crash
+        mid-import leaves nothing behind and the next start tries again.
+        """
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_import'").fetchone():
+            return 0
+        if conn.execute("SELECT 1 FROM songs LIMIT 1").fetchone():
+            # Databases created before the meta table already hold their imported songs.
+            songs = []
+        elif path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                songs = json.load(f)
+            for song in songs:
+                self._insert(conn, song)
+        else:
+            return 0
+        conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_import', ?)", (json.dumps({"path": path, "songs": len(songs)}),))
+        return len(songs)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA foreign_keys=ON")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def append(self, song):
+        with self._connect() as conn:
+            return self._insert(conn, song)
+
+    def import_json(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            songs = json.load(f)
+        with self._connect() as conn:
+            for song in songs:
+                self._insert(conn, song)
+        return len(songs)
+
+    def _insert(self, conn, song):
+        data = {k: v for k, v in song.items() if not k.startswith("_")}
+        cursor = conn.execute(
+            "INSERT INTO songs (title, tone, created_at, approved, data, revision) "
+            "VALUES (?, ?, ?, ?, ?, (SELECT COALESCE(MAX(revision), 0) + 1 FROM songs))",
+            (
+                data.get("title"),
+                str(data.get("tone", "")).strip().lower(),
+                data.get("created_at"),
+                self._approval_flag(data.get("approved_for_future_inspiration")),
+                json.dumps(data, ensure_ascii=False)
+            )
+        )
+        song_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO song_tags (song_id, tag) VALUES (?, ?)",
+            [(song_id, str(tag).strip().lower()) for tag in set(data.get("tags") or [])]
+        )
+        return song_id
+
+    def update(self, song_id, song):
+        data = {k: v for k, v in song.items() if not k.startswith("_")}
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE songs SET title = ?, tone = ?, created_at = ?, approved = ?, data = ?, "
+                "revision = (SELECT COALESCE(MAX(revision), 0) + 1 FROM songs) WHERE id = ?",
+                (
+                    data.get("title"),
+                    str(data.get("tone", "")).strip().lower(),
+                    data.get("created_at"),
+                    self._approval_flag(data.get("approved_for_future_inspiration")),
+                    json.dumps(data, ensure_ascii=False),
+                    song_id
+                )
+            )
+            conn.execute("DELETE FROM song_tags WHERE song_id = ?", (song_id,))
+            conn.executemany(
+                "INSERT INTO song_tags (song_id, tag) VALUES (?, ?)",
+                [(song_id, str(tag).strip().lower()) for tag in set(data.get("tags") or [])]
+            )
+
+    def set_approved(self, song_id, approved=True):
+        song = self.get(song_id)
+        if song is None:
+            raise KeyError(f"No song with id {song_id} in {self.db_path}")
+        song["approved_for_future_inspiration"] = bool(approved)
+        self.update(song_id, song)
+
+    def get(self, song_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT id, data FROM songs WHERE id = ?", (song_id,)).fetchone()
+        return self._to_song(row) if row else None
+
+    def query(self, tag=None, tone=None, created_after=None, created_before=None, approved=None, limit=None):
+        """Songs matching every given filter, oldest first. Each carries its row id as `_songbook_id`."""
+        sql = "SELECT id, data FROM songs WHERE 1 = 1"
+        params = []
+        if tag is not None:
+            sql += " AND id IN (SELECT song_id FROM song_tags WHERE tag = ?)"
+            params.append(tag.strip().lower())
+        if tone is not None:
+            sql += " AND tone = ?"
+            params.append(tone.strip().lower())
+        if created_after is not None:
+            sql += " AND created_at >= ?"
+            params.append(created_after)
+        if created_before is not None:
+            sql += " AND created_at < ?"
+            params.append(created_before)
+        if approved is not None:
+            sql += " AND approved = ?"
+            params.append(1 if approved else 0)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [self._to_song(row) for row in rows]
+
+    def approval_changes(self, since_revision=None):
+        """Rows written after `since_revision` (all rows when None), for keeping a mirror of the approved songs.
+
+        Returns (revision, [(song_id, approved, song)]); `song` is only decoded
+        for approved rows. Pass the returned revision back in next time.
+        """
+        sql = "SELECT id, approved, revision, CASE WHEN approved = 1 THEN data END FROM songs"
+        params = []
+        if since_revision is not None:
+            sql += " WHERE revision > ?"
+            params.append(since_revision)
+        with self._connect() as conn:
+            rows = conn.execute(sql + " ORDER BY revision", params).fetchall()
+        revision = rows[-1][2] if rows else since_revision
+        changes = [(song_id, approved == 1, self._to_song((song_id, data)) if data else None) for song_id, approved, _, data in rows]
+        return revision, changes
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM songs").fetchone()[0]
+
+    def export_json(self, path="shanty_songbook.json"):
+        """Write the whole songbook in the original shanty_songbook.json list format."""
+        songs = [{k: v for k, v in song.items() if not k.startswith("_")} for song in self.query()]
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(songs, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return len(songs)
+
+    def _to_song(self, row):
+        song = json.loads(row[1])
+        song["_songbook_id"] = row[0]
+        return song
+
+    @staticmethod
+    def _approval_flag(value):
+        # The songbook uses the string "None" for "not reviewed yet".
+        if value is True or str(value).strip().lower() in ("true", "yes", "1", "approved"):
+            return 1
+        if value is False or str(value).strip().lower() in ("false", "no", "0", "rejected"):
+            return 0
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the Wanderlight's songbook database.")
+    parser.add_argument("command", choices=["export", "import", "count"])
+    parser.add_argument("--db", default="shanty_songbook.db")
+    parser.add_argument("--json", default="shanty_songbook.json")
+    args = parser.parse_args()
+
+    store = SongbookStore(args.db, legacy_json_path=None)
+    if args.command == "export":
+        print(f"✅ Exported {store.export_json(args.json)} songs to {args.json}")
+    elif args.command == "import":
+        print(f"✅ Imported {store.import_json(args.json)} songs from {args.json}")
+    else:
+        print(store.count())
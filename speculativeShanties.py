@@ -0,0 +1,287 @@
+import argparse
+import itertools
+import json
+import math
+import queue
+import sys
+import threading
+import time
+from museService import MuseService
+from composerService import ShantyComposerService
+from philosopherService import EvaluationAgentService
+from songUtils import mean_score
+
+# (upper bound, label); readings at or above the last bound fall in the final band.
+TEMPERATURE_BANDS = [(5, "freezing"), (12, "cold"), (18, "cool"), (25, "mild"), (None, "hot")]  # °C
+WIND_BANDS = [(1, "calm"), (7, "light air"), (11, "gentle breeze"), (17, "fresh breeze"), (28, "strong wind"), (None, "gale")]  # knots
+TIMES_OF_DAY = ["dawn", "morning", "afternoon", "dusk", "night"]
+HOUR_STARTS = [(5, "dawn"), (8, "morning"), (12, "afternoon"), (17, "dusk"), (20, "night")]
+
+
+def _band(value, bands):
+    for upper, label in bands:
+        if upper is None or value < upper:
+            return label
+
+
+def _number(reading, key):
+    """The reading's `key` as a finite float, or None (with a warning) when it's missing or not a number."""
+    value = reading.get(key)
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        number = math.nan
+    if not math.isfinite(number) or isinstance(value, bool):
+        print(f"⚠️ Ignoring {key} reading {value!r}: not a number")
+        return None
+    return number
+
+
+def _time_of_day(reading):
+    if reading.get("time_of_day") in TIMES_OF_DAY:
+        return reading["time_of_day"]
+    hour = _number(reading, "hour")
+    if hour is None:
+        time_of_day = reading.get("time_of_day")
+        return time_of_day if isinstance(time_of_day, str) else None
+    label = "night"
+    for start, name in HOUR_STARTS:
+        if hour >= start:
+            label = name
+    return label
+
+
+def condition_bucket(reading):
+    """Quantize a raw telemetry reading into a hashable condition bucket.
+
+    Small sensor jitter lands in the same bucket, so shanties generated for a
+    bucket stay valid until conditions really change. A reading that is missing
+    or garbled (say "n/a" from a flaky sensor) leaves its condition unset.
+    """
+    temperature = _number(reading, "temperature")
+    wind = _number(reading, "wind_speed")
+    sightings = reading.get("sightings") or []
+    if isinstance(sightings, str):
+        sightings = [sightings]
+    elif not isinstance(sightings, (list, tuple)):
+        print(f"⚠️ Ignoring sightings reading {sightings!r}: not a list")
+        sightings = []
+    crew_mood = reading.get("crew_mood")
+    return (
+        ("temperature", _band(temperature, TEMPERATURE_BANDS) if temperature is not None else None),
+        ("wind_speed", _band(wind, WIND_BANDS) if wind is not None else None),
+        ("time_of_day", _time_of_day(reading)),
+        ("sightings", tuple(sorted({str(s).lower() for s in sightings}))),
+        ("crew_mood", crew_mood if isinstance(crew_mood, str) else None),
+    )
+
+
+def neighbour_buckets(bucket, limit=4):
+    """The buckets conditions are most likely to drift into next, most likely first."""
+    conditions = dict(bucket)
+    candidates = []
+    if conditions["time_of_day"] in TIMES_OF_DAY:
+        # Time only moves forward.
+        upcoming = TIMES_OF_DAY[(TIMES_OF_DAY.index(conditions["time_of_day"]) + 1) % len(TIMES_OF_DAY)]
+        candidates.append(("time_of_day", upcoming))
+    for key, bands in (("wind_speed", WIND_BANDS), ("temperature", TEMPERATURE_BANDS)):
+        labels = [label for _, label in bands]
+        if conditions[key] in labels:
+            i = labels.index(conditions[key])
+            candidates.extend((key, labels[j]) for j in (i + 1, i - 1) if 0 <= j < len(labels))
+    if conditions["sightings"]:
+        candidates.append(("sightings", ()))
+    return [tuple((k, value if k == key else v) for k, v in bucket) for key, value in candidates[:limit]]
+
+
+def bucket_environment(bucket):
+    """Keyword arguments for MuseService.generate_shanty_prompt."""
+    conditions = dict(bucket)
+    conditions["sightings"] = list(conditions["sightings"])
+    return conditions
+
+
+class ConditionDebouncer:
+    """Only reports a new bucket once readings have stayed in it for `settle_seconds`."""
+
+    def __init__(self, settle_seconds=60, clock=time.monotonic):
+        self.settle_seconds = settle_seconds
+        self.clock = clock
+        self.current = None
+        self._candidate = None
+        self._candidate_since = None
+
+    def update(self, bucket):
+        """Returns the new current bucket when it changes, else None."""
+        now = self.clock()
+        if self.current is None:
+            self.current = bucket
+            return bucket
+        if bucket == self.current:
+            self._candidate = None
+            return None
+        if bucket != self._candidate:
+            self._candidate, self._candidate_since = bucket, now
+        if now - self._candidate_since >= self.settle_seconds:
+            self.current, self._candidate = bucket, None
+            return bucket
+        return None
+
+
+class SpeculativeShantyCache:
+    """Pre-generates evaluated shanties for the current conditions and the ones likely next.
+
+    Telemetry goes in through `observe`; `play` hands back the best ready shanty
+    for the current bucket without waiting on the LLM. Background workers keep
+    `per_bucket` fresh songs ready for the current bucket first, then its
+    neighbours; entries older than `ttl_seconds` count as stale and are replaced.
+    """
+
+    CURRENT, NEIGHBOUR = 0, 1
+
+    def __init__(self, muse=None, composer=None, evaluator=None, model="mistral", per_bucket=2,
+                 neighbours=3, ttl_seconds=3600, settle_seconds=60, workers=1, clock=time.monotonic):
+        self.composer = composer or ShantyComposerService()
+        self.muse = muse or MuseService(encoder=self.composer.songRepository.encoder)
+        self.evaluator = evaluator or EvaluationAgentService(model=model, repository=self.composer.songRepository)
+        self.model = model
+        self.per_bucket = per_bucket
+        self.neighbours = neighbours
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.debouncer = ConditionDebouncer(settle_seconds, clock)
+
+        self._lock = threading.Lock()
+        self._ready = {}        # bucket -> [{"song", "evaluations", "score", "generated_at"}]
+        self._in_flight = {}    # bucket -> number of generations queued or running
+        self._jobs = queue.PriorityQueue()
+        self._order = itertools.count()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "generated": 0, "failed": 0}
+        self.threads = [threading.Thread(target=self._work, name=f"speculate-{i}", daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    @property
+    def current(self):
+        return self.debouncer.current
+
+    def observe(self, reading):
+        """Feed one telemetry reading; returns the new bucket if conditions settled into one."""
+        changed = self.debouncer.update(condition_bucket(reading))
+        if changed is not None:
+            print(f"🧭 Conditions now {bucket_environment(changed)}")
+            self._top_up(changed, self.CURRENT)
+            for bucket in neighbour_buckets(changed, self.neighbours):
+                self._top_up(bucket, self.NEIGHBOUR)
+        return changed
+
+    def play(self):
+        """Best ready shanty for the current conditions, or None if nothing is ready yet."""
+        bucket = self.current
+        if bucket is None:
+            return None
+        with self._lock:
+            entries = self._ready.get(bucket, [])
+            fresh = [e for e in entries if not self._is_stale(e)]
+            pool = fresh or entries
+            entry = max(pool, key=lambda e: e["score"]) if pool else None
+            if entry is not None:
+                entries.remove(entry)
+            self.stats["hits" if fresh else "stale_hits" if entry else "misses"] += 1
+        # Replace what was just played (or refresh what went stale) in the background.
+        self._top_up(bucket, self.CURRENT)
+        return entry
+
+    def ready_counts(self):
+        with self._lock:
+            return {bucket: len(entries) for bucket, entries in self._ready.items() if entries}
+
+    def _is_stale(self, entry):
+        return self.clock() - entry["generated_at"] > self.ttl_seconds
+
+    def _top_up(self, bucket, priority):
+        with self._lock:
+            entries = self._ready.setdefault(bucket, [])
+            entries[:] = [e for e in entries if not self._is_stale(e)] or entries
+            fresh = sum(1 for e in entries if not self._is_stale(e))
+            wanted = self.per_bucket - fresh - self._in_flight.get(bucket, 0)
+            for _ in range(max(wanted, 0)):
+                self._in_flight[bucket] = self._in_flight.get(bucket, 0) + 1
+                self._jobs.put((priority, next(self._order), bucket))
+
+    def _work(self):
+        while True:
+            priority, _, bucket = self._jobs.get()
+            # Neighbour work queued before the conditions moved on may no longer be worth doing.
+            if priority == self.NEIGHBOUR and bucket != self.current and bucket not in neighbour_buckets(self.current, self.neighbours):
+                self._finish(bucket, None)
+                continue
+            try:
+                entry = self._generate(bucket)
+            except Exception as e:
+                print(f"❌ Speculative generation failed: {e}")
+                entry = None
+            self._finish(bucket, entry, failed=entry is None)
+
+    def _finish(self, bucket, entry, failed=False):
+        with self._lock:
+            self._in_flight[bucket] -= 1
+            if entry is not None:
+                self._ready.setdefault(bucket, []).append(entry)
+                self.stats["generated"] += 1
+            if failed:
+                self.stats["failed"] += 1
+
+    def _generate(self, bucket):
+        prompt = self.muse.generate_shanty_prompt(model=self.model, **bucket_environment(bucket))
+        if not prompt:
+            return None
+        song_id, song = self.composer.compose_entry(prompt, model=self.model)
+        if not song:
+            return None
+        evaluations = self.evaluator.evaluate(song)
+        self.composer.songbook.update(song_id, dict(song, evaluations=evaluations))
+        return {"song": song, "songbook_id": song_id, "evaluations": evaluations, "score": mean_score(evaluations), "generated_at": self.clock()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read telemetry JSON lines from stdin and keep shanties ready for the conditions.")
+    parser.add_argument("--model", default="mistral")
+    parser.add_argument("--per-bucket", type=int, default=2)
+    parser.add_argument("--neighbours", type=int, default=3)
+    parser.add_argument("--settle-seconds", type=float, default=60)
+    parser.add_argument("--ttl-seconds", type=float, default=3600)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    cache = SpeculativeShantyCache(
+        model=args.model,
+        per_bucket=args.per_bucket,
+        neighbours=args.neighbours,
+        ttl_seconds=args.ttl_seconds,
+        settle_seconds=args.settle_seconds,
+        workers=args.workers,
+    )
+    print('📡 Send readings like {"temperature": 14, "wind_speed": 9, "hour": 18}; send {"play": true} for a shanty.')
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"⚠️ Skipping a line that isn't JSON: {e}")
+            continue
+        if not isinstance(message, dict):
+            print("⚠️ Skipping a line that isn't a JSON object")
+            continue
+        if message.pop("play", False):
+            entry = cache.play()
+            if entry is None:
+                print("⏳ Nothing ready for these conditions yet")
+            else:
+                print(f"🎶 {entry['song'].get('title')} (score {entry['score']:.2f})")
+                print(entry["song"].get("lines", ""))
+        if message:
+            cache.observe(message)
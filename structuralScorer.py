@@ -0,0 +1,128 @@
+import json
+import re
+import time
+import numpy as np
+from songUtils import song_lyrics
+
+WORD = re.compile(r"[a-z']+")
+
+# Everyday sea words the knowledge file takes for granted.
+CORE_SEA_WORDS = [
+    "sea", "seas", "sail", "sails", "sailing", "ship", "ships", "wind", "winds", "tide", "tides", "wave", "waves",
+    "deck", "mast", "anchor", "captain", "crew", "haul", "heave", "shore", "port", "harbor", "harbour", "bow",
+    "stern", "helm", "rope", "line", "lines", "storm", "gale", "ocean", "shanty", "sailor", "sailors", "voyage",
+    "hull", "keel", "rigging", "oar", "oars", "fog", "lake", "starboard", "larboard", "aboard", "ashore",
+]
+
+
+class StructuralScorer:
+    """Millisecond structural and lexical checks for a song, run before any LLM evaluator.
+
+    Follows the structure/vocabulary half of the HybridPhilosopher sketch in
+    criticpsuedocode.txt: line-length consistency, chorus repetition, vocabulary
+    richness and nautical vocabulary drawn from facts/nautical_knowledge.json.
+    Every component is scored 0–1; `overall` is their weighted mean. A song is
+    rejected below `threshold`, or outright when it is too short, stuck repeating
+    one line, or mostly markup. The gate is meant for obviously broken output;
+    judging whether a real song is any good stays with the LLM evaluators.
+    """
+
+    # Plenty of real shanties never name a rope or a mast, so sea vocabulary counts for less.
+    WEIGHTS = {"length": 1.0, "line_consistency": 1.0, "repetition": 1.0, "richness": 1.0, "nautical": 0.5, "legibility": 1.0}
+
+    def __init__(self, knowledge_path="facts/nautical_knowledge.json", threshold=0.6, min_lines=4, max_lines=120):
+        self.threshold = threshold
+        self.min_lines = min_lines
+        self.max_lines = max_lines
+        terms = set(CORE_SEA_WORDS) | self._knowledge_terms(knowledge_path)
+        # Longest first so "topping lift" wins over "lift".
+        alternation = "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True))
+        self.nautical_pattern = re.compile(rf"\b(?:{alternation})\b")
+
+    @staticmethod
+    def _knowledge_terms(path):
+        with open(path, "r", encoding="utf-8") as f:
+            knowledge = json.load(f)
+        terms = set()
+        for entries in knowledge.values():
+            for entry in entries:
+                for key in ("name", "theme"):
+                    if isinstance(entry.get(key), str):
+                        terms.add(entry[key].lower())
+        return terms
+
+    def score(self, song):
+        started = time.perf_counter()
+        lines = [line.strip() for line in song_lyrics(song).split("\n") if line.strip()]
+        reasons = []
+        if len(lines) < self.min_lines:
+            return self._result(0.0, {}, [f"Only {len(lines)} lyric line(s)"], started, hard_fail=True)
+
+        lowered = [line.lower() for line in lines]
+        words = [WORD.findall(line) for line in lowered]
+        counts = np.array([len(w) for w in words], dtype=np.float32)
+        all_words = [w for line in words for w in line]
+        if not all_words:
+            return self._result(0.0, {}, ["No words in the lyrics"], started, hard_fail=True)
+
+        components = {}
+
+        components["length"] = 1.0 if len(lines) <= self.max_lines else max(0.0, 1 - (len(lines) - self.max_lines) / self.max_lines)
+        if components["length"] < 1:
+            reasons.append(f"{len(lines)} lines is far longer than a shanty")
+
+        # Singable verses keep lines of similar length; a coefficient of variation near 1 means ragged prose.
+        cv = float(counts.std() / counts.mean()) if counts.mean() else 1.0
+        components["line_consistency"] = float(np.clip(1.2 - cv, 0.0, 1.0))
+        if components["line_consistency"] < 0.5:
+            reasons.append(f"Line lengths vary a lot (cv {cv:.2f})")
+
+        normalized = [" ".join(w) for w in words]
+        repeats = {}
+        for line in normalized:
+            repeats[line] = repeats.get(line, 0) + 1
+        chorus_lines = sum(1 for line, n in repeats.items() if n >= 2 and line)
+        top_share = max(repeats.values()) / len(normalized)
+        # Traditional shanties repeat a lot; only a single line filling most of the song means a stuck model.
+        looping = top_share > 0.5 and (len(repeats) == 1 or len(repeats) / len(normalized) < 0.15)
+        if looping:
+            components["repetition"] = 0.0
+            reasons.append(f"One line makes up {top_share:.0%} of the song")
+        else:
+            # As in the sketch: a repeated chorus scores full marks, no chorus 0.6.
+            components["repetition"] = 1.0 if chorus_lines else 0.6
+
+        # Type-token ratio over a fixed window, so long songs aren't penalised for length.
+        window = 100
+        ratios = [len(set(all_words[i:i + window])) / len(all_words[i:i + window]) for i in range(0, len(all_words), window)]
+        richness = float(np.mean(ratios))
+        components["richness"] = float(np.clip(richness / 0.5, 0.0, 1.0))
+        if components["richness"] < 0.6:
+            reasons.append(f"Thin vocabulary (type-token ratio {richness:.2f})")
+
+        nautical_lines = sum(1 for line in lowered if self.nautical_pattern.search(line))
+        components["nautical"] = float(min(1.0, nautical_lines / (0.25 * len(lines))))
+        if components["nautical"] < 0.5:
+            reasons.append(f"Little sea vocabulary ({nautical_lines} of {len(lines)} lines)")
+
+        text = "".join(lowered)
+        visible = sum(1 for ch in text if not ch.isspace())
+        letters = sum(1 for ch in text if ch.isalpha())
+        components["legibility"] = float(np.clip((letters / visible - 0.6) / 0.25, 0.0, 1.0)) if visible else 0.0
+        if components["legibility"] < 0.5:
+            reasons.append("Lyrics look like markup or code rather than verse")
+
+        total_weight = sum(self.WEIGHTS.values())
+        overall = sum(self.WEIGHTS[name] * value for name, value in components.items()) / total_weight
+        return self._result(overall, components, reasons, started, hard_fail=looping or components["legibility"] < 0.5)
+
+    def _result(self, overall, components, reasons, started, hard_fail=False):
+        return {
+            "score": round(1 + 4 * overall, 1),  # same 1–5 scale as the LLM evaluators
+            "overall": round(overall, 3),
+            "rejected": hard_fail or overall < self.threshold,
+            "threshold": self.threshold,
+            "components": {name: round(value, 3) for name, value in components.items()},
+            "reasons": reasons,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
@@ -0,0 +1,102 @@
+import json
+import math
+import os
+import faiss
+import numpy as np
+
+DEFAULT_INDEX_CONFIG = {
+    "kind": "flat",      # flat | ivf | hnsw
+    "nlist": 256,        # ivf: number of coarse clusters (clamped for small corpora)
+    "nprobe": 8,         # ivf: clusters visited per query
+    "hnsw_m": 32,        # hnsw: graph neighbours per node
+    "ef_search": 64,     # hnsw: candidate list size per query
+    "pq_m": None,        # optional product quantization: sub-vectors per embedding
+    "quantization": None,  # optional scalar quantization of stored vectors: fp16 | int8
+}
+
+SCALAR_CODECS = {"fp16": "SQfp16", "int8": "SQ8"}
+STORAGE_DTYPES = {None: "float32", "fp16": "float16", "int8": "int8"}
+
+
+def make_index_config(config=None, **overrides):
+    merged = dict(DEFAULT_INDEX_CONFIG)
+    merged.update(config or {})
+    merged.update(overrides)
+    if merged["kind"] not in ("flat", "ivf", "hnsw"):
+        raise ValueError(f"Unknown index kind: {merged['kind']}")
+    if merged["quantization"] not in STORAGE_DTYPES:
+        raise ValueError(f"Unknown quantization: {merged['quantization']}")
+    if merged["quantization"] and merged["pq_m"]:
+        raise ValueError("Choose either scalar quantization or pq_m, not both")
+    return merged
+
+
+def factory_string(config, dim, n_train):
+    """faiss.index_factory description for `config`, with training sizes clamped to the corpus."""
+    if config["pq_m"] and dim % config["pq_m"]:
+        raise ValueError(f"pq_m={config['pq_m']} must divide the embedding size {dim}")
+    # k-means needs at least as many points as centroids.
+    pq_bits = max(1, min(8, int(math.log2(max(n_train, 2)))))
+    if config["pq_m"]:
+        codec = f"PQ{config['pq_m']}x{pq_bits}"
+    else:
+        codec = SCALAR_CODECS.get(config["quantization"], "Flat")
+
+    if config["kind"] == "flat":
+        return codec
+    if config["kind"] == "ivf":
+        return f"IVF{effective_nlist(config, n_train)},{codec}"
+    return f"HNSW{config['hnsw_m']}" + (f"_{codec}" if codec != "Flat" else "")
+
+
+def effective_nlist(config, n_train):
+    return max(1, min(config["nlist"], n_train // 39 or 1))
+
+
+def build_index(embeddings, ids, config):
+    """Train (when the index type needs it) and fill an id-mapped index."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    spec = factory_string(config, embeddings.shape[1], len(embeddings))
+    index = faiss.IndexIDMap2(faiss.index_factory(embeddings.shape[1], spec))
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+    return index, spec
+
+
+def search_params(index, config, selector=None):
+    inner = faiss.downcast_index(index.index if isinstance(index, faiss.IndexIDMap2) else index)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=config["nprobe"])
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=config["ef_search"])
+    return faiss.SearchParameters(sel=selector)
+
+
+def supports_removal(config):
+    # faiss HNSW graphs can't drop nodes; callers mask removed ids instead.
+    return config["kind"] != "hnsw"
+
+
+def index_bytes(index):
+    return int(faiss.serialize_index(index).size)
+
+
+def save_index(index, path, meta):
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+    with open(path + ".json.tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(path + ".json.tmp", path + ".json")
+
+
+def load_index(path, meta):
+    """The saved index at `path` if every key of `meta` matches what was saved with it, else None."""
+    if not (os.path.exists(path) and os.path.exists(path + ".json")):
+        return None
+    with open(path + ".json", "r", encoding="utf-8") as f:
+        saved = json.load(f)
+    if any(saved.get(key) != value for key, value in meta.items()):
+        return None
+    return faiss.read_index(path)
@@ -0,0 +1,7 @@
+# Shared by shantyWeaverDaemon and shantyClient. Keep this module free of heavy imports:
+# the client imports it and should start in milliseconds.
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Sailing conditions MuseService.generate_shanty_prompt understands.
+ENVIRONMENT_KEYS = ("temperature", "wind_speed", "time_of_day", "sightings", "crew_mood")